@@ -1,18 +1,13 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
 from datetime import datetime, timedelta
-import time
 import os
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from utils.api_clients import EnergyDataAPI
-from utils.data_processor import DataProcessor
-from utils.alerts import AlertSystem
+from utils.services import get_services, fetch_concurrently
 
 # Configure page settings
 st.set_page_config(
@@ -30,39 +25,25 @@ if 'last_update' not in st.session_state:
 if 'alerts' not in st.session_state:
     st.session_state.alerts = []
 
-# Initialize API clients and processors
-@st.cache_resource
-def init_services():
-    api_client = EnergyDataAPI()
-    data_processor = DataProcessor()
-    alert_system = AlertSystem()
-    return api_client, data_processor, alert_system
-
-api_client, data_processor, alert_system = init_services()
+# Initialize API clients and processors (shared with the other pages)
+api_client, data_processor, alert_system = get_services()
 
 # Main navigation
 st.sidebar.title("🛢️ Houston Energy Analytics")
 st.sidebar.markdown("---")
 
-page = st.sidebar.selectbox(
-    "Navigate to:",
-    ["Real-Time Dashboard", "Historical Analysis", "Price Forecasting", "Alert Management"]
-)
-
-# Auto-refresh toggle
+# Auto-refresh toggle (reruns only the dashboard's live data fragment)
 auto_refresh = st.sidebar.checkbox("Auto-refresh (30s)", value=False)
-if auto_refresh:
-    time.sleep(30)
-    st.rerun()
 
 # Manual refresh button
 if st.sidebar.button("🔄 Refresh Data"):
     st.session_state.data_cache.clear()
+    api_client.clear_cache()
     st.rerun()
 
 # Data freshness indicator
 if st.session_state.last_update:
-    minutes_ago = (datetime.now() - st.session_state.last_update).seconds // 60
+    minutes_ago = int((datetime.now() - st.session_state.last_update).total_seconds() // 60)
     if minutes_ago < 5:
         st.sidebar.success(f"Data fresh ({minutes_ago}m ago)")
     elif minutes_ago < 30:
@@ -70,15 +51,36 @@ if st.session_state.last_update:
     else:
         st.sidebar.error(f"Data stale ({minutes_ago}m ago)")
 
-# Page routing
-if page == "Real-Time Dashboard":
-    # Main dashboard content
-    st.title("⚡ Houston Energy Market Dashboard")
-    st.markdown("Real-time energy commodity prices and market insights")
+def get_price_figure(key, traces, title):
+    """Get the session's dashboard price figure, refreshing trace data in place"""
+    fig = st.session_state.get(key)
     
-    # Test if this content shows up
-    st.success("Dashboard is loading successfully!")
+    if fig is None or [trace.name for trace in fig.data] != [trace['name'] for trace in traces]:
+        # Plotly is only needed by the dashboard, so other pages don't pay for importing it
+        import plotly.graph_objects as go
+        
+        fig = go.Figure()
+        for trace in traces:
+            fig.add_trace(go.Scatter(mode='lines', **trace))
+        fig.update_layout(
+            title=title,
+            xaxis_title="Date",
+            yaxis_title="Price (USD)",
+            height=300
+        )
+        st.session_state[key] = fig
+    else:
+        # Same traces as last run, so only swap in the new data
+        with fig.batch_update():
+            for fig_trace, trace in zip(fig.data, traces):
+                fig_trace.x = trace['x']
+                fig_trace.y = trace['y']
     
+    return fig
+
+# Real-Time Dashboard live data, rerun on its own when auto-refresh is on
+@st.fragment(run_every=30 if auto_refresh else None)
+def render_market_data():
     # Initialize variables
     wti_price = brent_price = gas_price = None
     oil_data = gas_data = renewable_data = None
@@ -87,8 +89,13 @@ if page == "Real-Time Dashboard":
     try:
         st.info("Attempting to load market data...")
         
+        # The three sources are independent, so fetch them side by side
+        # (the API client caches each, so reruns within the TTL skip the network)
+        oil_data, gas_data, renewable_data = fetch_concurrently(
+            api_client.get_oil_prices, api_client.get_natural_gas_prices, api_client.get_renewable_energy_data
+        )
+        
         # Oil prices
-        oil_data = api_client.get_oil_prices()
         if oil_data is not None and not oil_data.empty:
             st.success(f"Oil data loaded successfully! Shape: {oil_data.shape}")
             if 'WTI' in oil_data.columns:
@@ -99,7 +106,6 @@ if page == "Real-Time Dashboard":
             st.warning("No oil price data available from Yahoo Finance")
         
         # Natural gas prices
-        gas_data = api_client.get_natural_gas_prices()
         if gas_data is not None and not gas_data.empty and 'Price' in gas_data.columns:
             gas_price = gas_data['Price'].iloc[-1]
             st.success("Natural gas data loaded successfully!")
@@ -107,7 +113,6 @@ if page == "Real-Time Dashboard":
             st.warning("No natural gas data available")
         
         # Renewable energy data
-        renewable_data = api_client.get_renewable_energy_data()
         if renewable_data is not None:
             st.success("Renewable energy data loaded")
         
@@ -168,49 +173,23 @@ if page == "Real-Time Dashboard":
     
     with chart_col1:
         if oil_data is not None and not oil_data.empty:
-            fig_oil = go.Figure()
+            oil_traces = []
             if 'WTI' in oil_data.columns:
-                fig_oil.add_trace(go.Scatter(
-                    x=oil_data.index,
-                    y=oil_data['WTI'],
-                    mode='lines',
-                    name='WTI Crude',
-                    line=dict(color='#FF6B35')
-                ))
+                wti_x, wti_y = data_processor.downsample_lttb(oil_data.index.to_numpy(), oil_data['WTI'].to_numpy())
+                oil_traces.append(dict(x=wti_x, y=wti_y, name='WTI Crude', line=dict(color='#FF6B35')))
             if 'Brent' in oil_data.columns:
-                fig_oil.add_trace(go.Scatter(
-                    x=oil_data.index,
-                    y=oil_data['Brent'],
-                    mode='lines',
-                    name='Brent Crude',
-                    line=dict(color='#4ECDC4')
-                ))
-            fig_oil.update_layout(
-                title="Oil Prices ($/barrel)",
-                xaxis_title="Date",
-                yaxis_title="Price (USD)",
-                height=300
-            )
+                brent_x, brent_y = data_processor.downsample_lttb(oil_data.index.to_numpy(), oil_data['Brent'].to_numpy())
+                oil_traces.append(dict(x=brent_x, y=brent_y, name='Brent Crude', line=dict(color='#4ECDC4')))
+            fig_oil = get_price_figure('fig_oil', oil_traces, "Oil Prices ($/barrel)")
             st.plotly_chart(fig_oil, use_container_width=True)
         else:
             st.info("Oil price data not available")
     
     with chart_col2:
         if gas_data is not None and not gas_data.empty:
-            fig_gas = go.Figure()
-            fig_gas.add_trace(go.Scatter(
-                x=gas_data.index,
-                y=gas_data['Price'],
-                mode='lines',
-                name='Natural Gas',
-                line=dict(color='#45B7D1')
-            ))
-            fig_gas.update_layout(
-                title="Natural Gas Prices ($/MMBtu)",
-                xaxis_title="Date",
-                yaxis_title="Price (USD)",
-                height=300
-            )
+            gas_x, gas_y = data_processor.downsample_lttb(gas_data.index.to_numpy(), gas_data['Price'].to_numpy())
+            gas_traces = [dict(x=gas_x, y=gas_y, name='Natural Gas', line=dict(color='#45B7D1'))]
+            fig_gas = get_price_figure('fig_gas', gas_traces, "Natural Gas Prices ($/MMBtu)")
             st.plotly_chart(fig_gas, use_container_width=True)
         else:
             st.info("Natural gas price data not available")
@@ -222,6 +201,17 @@ if page == "Real-Time Dashboard":
             st.warning(f"**{alert['timestamp']}**: {alert['message']}")
     else:
         st.info("No active alerts")
+
+# Real-Time Dashboard page
+def render_dashboard():
+    # Main dashboard content
+    st.title("⚡ Houston Energy Market Dashboard")
+    st.markdown("Real-time energy commodity prices and market insights")
+    
+    # Test if this content shows up
+    st.success("Dashboard is loading successfully!")
+    
+    render_market_data()
     
     # Houston-specific information
     st.subheader("🏙️ Houston Energy Market Focus")
@@ -246,11 +236,11 @@ if page == "Real-Time Dashboard":
         - Texas renewable capacity
         """)
 
-elif page == "Historical Analysis":
-    exec(open('pages/historical_analysis.py').read())
-
-elif page == "Price Forecasting":
-    exec(open('pages/forecasting.py').read())
-
-elif page == "Alert Management":
-    exec(open('pages/alerts.py').read())
+# Page routing
+pg = st.navigation([
+    st.Page(render_dashboard, title="Real-Time Dashboard", icon="⚡", default=True),
+    st.Page("pages/historical_analysis.py", title="Historical Analysis", icon="📊"),
+    st.Page("pages/forecasting.py", title="Price Forecasting", icon="🔮"),
+    st.Page("pages/alerts.py", title="Alert Management", icon="🚨"),
+])
+pg.run()
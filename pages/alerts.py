@@ -1,87 +1,101 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
-import plotly.express as px
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pa_csv
 from datetime import datetime, timedelta
+from collections import deque
 
 st.title("🚨 Energy Market Alert System")
 st.markdown("Configure and monitor energy market alerts for price movements and market conditions")
 
-# Import required modules
-from utils.api_clients import EnergyDataAPI
-from utils.alerts import AlertSystem
-from utils.data_processor import DataProcessor
+# Shared services, so alert history is the same one the dashboard sees
+from utils.services import get_services, fetch_concurrently
+from utils.alerts import ALERT_FRAME_DTYPES
 
-api_client = EnergyDataAPI()
-alert_system = AlertSystem()
-data_processor = DataProcessor()
+api_client, data_processor, alert_system = get_services()
 
 # Initialize session state for alerts
 if 'active_alerts' not in st.session_state:
-    st.session_state.active_alerts = []
+    st.session_state.active_alerts = deque(maxlen=100)  # Keep only recent alerts (last 100)
+if 'active_alerts_revision' not in st.session_state:
+    st.session_state.active_alerts_revision = 0
+
+def materialize_alerts(active_alerts, alert_frame):
+    """Merge session and system alerts, drop duplicates and sort newest first"""
+    frames = [alert_frame.reset_index()]
+    if active_alerts:
+        frames.insert(0, pd.DataFrame(list(active_alerts), columns=frames[0].columns))
+    merged = pd.concat(frames, ignore_index=True)
+    merged = merged.drop_duplicates(subset=['timestamp', 'message'])
+    # Small fixed vocabularies, so filters compare category codes instead of strings
+    merged = merged.astype(ALERT_FRAME_DTYPES)
+    return merged.sort_values('timestamp', ascending=False, kind='stable')
 
 # Alert Configuration Section
 st.subheader("⚙️ Alert Configuration")
 
 with st.expander("Configure Alert Rules", expanded=False):
-    col1, col2 = st.columns(2)
+    with st.form("alert_config_form"):
+        col1, col2 = st.columns(2)
     
-    with col1:
-        st.markdown("**Price Movement Alerts**")
-        price_threshold = st.slider(
-            "Price Change Threshold (%)",
-            min_value=1.0,
-            max_value=20.0,
-            value=5.0,
-            step=0.5,
-            help="Alert when price changes exceed this percentage"
-        )
+        with col1:
+            st.markdown("**Price Movement Alerts**")
+            price_threshold = st.slider(
+                "Price Change Threshold (%)",
+                min_value=1.0,
+                max_value=20.0,
+                value=5.0,
+                step=0.5,
+                help="Alert when price changes exceed this percentage"
+            )
         
-        volatility_threshold = st.slider(
-            "Volatility Threshold",
-            min_value=0.1,
-            max_value=1.0,
-            value=0.3,
-            step=0.05,
-            help="Alert when volatility exceeds this level"
-        )
+            volatility_threshold = st.slider(
+                "Volatility Threshold",
+                min_value=0.1,
+                max_value=1.0,
+                value=0.3,
+                step=0.05,
+                help="Alert when volatility exceeds this level"
+            )
     
-    with col2:
-        st.markdown("**Technical Analysis Alerts**")
-        rsi_overbought = st.slider(
-            "RSI Overbought Level",
-            min_value=60,
-            max_value=90,
-            value=70,
-            help="Alert when RSI exceeds this level"
-        )
+        with col2:
+            st.markdown("**Technical Analysis Alerts**")
+            rsi_overbought = st.slider(
+                "RSI Overbought Level",
+                min_value=60,
+                max_value=90,
+                value=70,
+                help="Alert when RSI exceeds this level"
+            )
         
-        rsi_oversold = st.slider(
-            "RSI Oversold Level",
-            min_value=10,
-            max_value=40,
-            value=30,
-            help="Alert when RSI falls below this level"
-        )
+            rsi_oversold = st.slider(
+                "RSI Oversold Level",
+                min_value=10,
+                max_value=40,
+                value=30,
+                help="Alert when RSI falls below this level"
+            )
     
-    # Advanced alert options
-    st.markdown("**Advanced Alert Options**")
-    enable_correlation_alerts = st.checkbox("Enable Correlation Alerts", value=True)
-    enable_technical_alerts = st.checkbox("Enable Technical Analysis Alerts", value=True)
-    enable_ma_cross_alerts = st.checkbox("Enable Moving Average Crossover Alerts", value=True)
+        # Advanced alert options
+        st.markdown("**Advanced Alert Options**")
+        enable_correlation_alerts = st.checkbox("Enable Correlation Alerts", value=True)
+        enable_technical_alerts = st.checkbox("Enable Technical Analysis Alerts", value=True)
+        enable_ma_cross_alerts = st.checkbox("Enable Moving Average Crossover Alerts", value=True)
     
-    # Update alert rules
-    if st.button("Update Alert Rules"):
-        new_rules = {
-            'price_change_threshold': price_threshold,
-            'volatility_threshold': volatility_threshold,
-            'rsi_overbought': rsi_overbought,
-            'rsi_oversold': rsi_oversold,
-            'bollinger_band_breach': enable_technical_alerts,
-            'moving_average_cross': enable_ma_cross_alerts
-        }
-        alert_system.update_alert_rules(new_rules)
-        st.success("Alert rules updated successfully!")
+        # Update alert rules (widgets inside the form don't rerun the page until submitted)
+        submitted = st.form_submit_button("Update Alert Rules")
+        if submitted:
+            new_rules = {
+                'price_change_threshold': price_threshold,
+                'volatility_threshold': volatility_threshold,
+                'rsi_overbought': rsi_overbought,
+                'rsi_oversold': rsi_oversold,
+                'bollinger_band_breach': enable_technical_alerts,
+                'moving_average_cross': enable_ma_cross_alerts
+            }
+            alert_system.update_alert_rules(new_rules)
+            st.success("Alert rules updated successfully!")
 
 # Real-time Alert Generation
 st.subheader("🔴 Live Alert Monitor")
@@ -90,18 +104,23 @@ st.subheader("🔴 Live Alert Monitor")
 if st.button("🔍 Check for New Alerts", type="primary"):
     with st.spinner("Checking market conditions for alerts..."):
         # Load current market data
-        oil_data = api_client.get_oil_prices()
-        gas_data = api_client.get_natural_gas_prices()
+        oil_data, gas_data = fetch_concurrently(
+            api_client.get_oil_prices, api_client.get_natural_gas_prices
+        )
+        
+        # One consolidated float64 block per frame, so every indicator in the
+        # alert checks slices contiguous price columns instead of re-casting them
+        if oil_data is not None:
+            oil_data = oil_data.astype(np.float64)
+        if gas_data is not None:
+            gas_data = gas_data.astype(np.float64)
         
         # Generate alerts
         new_alerts = alert_system.generate_all_alerts(oil_data, gas_data)
         
-        # Add to session state
+        # Add to session state (oldest alerts drop off past 100)
         st.session_state.active_alerts.extend(new_alerts)
-        
-        # Keep only recent alerts (last 100)
-        if len(st.session_state.active_alerts) > 100:
-            st.session_state.active_alerts = st.session_state.active_alerts[-100:]
+        st.session_state.active_alerts_revision += 1
         
         if new_alerts:
             st.success(f"Generated {len(new_alerts)} new alerts!")
@@ -109,7 +128,12 @@ if st.button("🔍 Check for New Alerts", type="primary"):
             st.info("No new alerts generated")
 
 # Alert Summary Dashboard
-alert_summary = alert_system.get_alert_summary(hours=24)
+@st.cache_data(ttl=30, show_spinner=False)
+def compute_alert_summary(revision, hours):
+    """Summarize the last N hours of alerts (once per history revision; the TTL moves the window on)"""
+    return alert_system.get_alert_summary(hours=hours)
+
+alert_summary = compute_alert_summary(alert_system.revision, 24)
 
 col1, col2, col3, col4 = st.columns(4)
 
@@ -166,58 +190,50 @@ with alert_filter_col3:
 
 # Display alerts
 if st.session_state.active_alerts or alert_system.alert_history:
-    # Combine session alerts with system history
-    all_alerts = st.session_state.active_alerts + alert_system.alert_history
-    
-    # Remove duplicates based on timestamp and message
-    seen = set()
-    unique_alerts = []
-    for alert in all_alerts:
-        alert_key = (alert['timestamp'].isoformat(), alert['message'])
-        if alert_key not in seen:
-            seen.add(alert_key)
-            unique_alerts.append(alert)
-    
-    # Sort by timestamp (most recent first)
-    unique_alerts.sort(key=lambda x: x['timestamp'], reverse=True)
+    # Combine session alerts with system history, only when either changed
+    alerts_key = (alert_system.revision, st.session_state.active_alerts_revision)
+    cached_alerts = st.session_state.get('unique_alerts')
+    if cached_alerts is None or cached_alerts[0] != alerts_key:
+        cached_alerts = (alerts_key, materialize_alerts(st.session_state.active_alerts, alert_system.get_alert_frame()))
+        st.session_state.unique_alerts = cached_alerts
+    unique_alerts = cached_alerts[1]
     
-    # Apply filters
+    # Apply filters (alerts are created with lowercase severities and the
+    # commodity names offered in the filter, so these are exact matches)
     filtered_alerts = unique_alerts
     
     if severity_filter != "All":
-        filtered_alerts = [a for a in filtered_alerts if a['severity'].lower() == severity_filter.lower()]
+        filtered_alerts = filtered_alerts[filtered_alerts['severity'] == severity_filter.lower()]
     
     if commodity_filter != "All":
-        filtered_alerts = [a for a in filtered_alerts if commodity_filter.lower() in a['commodity'].lower()]
+        filtered_alerts = filtered_alerts[filtered_alerts['commodity'] == commodity_filter]
     
     if alert_type_filter != "All":
-        filtered_alerts = [a for a in filtered_alerts if a['type'] == alert_type_filter]
+        filtered_alerts = filtered_alerts[filtered_alerts['type'] == alert_type_filter]
     
     # Show only recent alerts (last 24 hours)
     cutoff_time = datetime.now() - timedelta(hours=24)
-    filtered_alerts = [a for a in filtered_alerts if a['timestamp'] > cutoff_time]
+    filtered_alerts = filtered_alerts[filtered_alerts['timestamp'] > cutoff_time]
     
-    if filtered_alerts:
-        for alert in filtered_alerts[:20]:  # Show only last 20 alerts
-            severity_color = {
-                'high': '🔴',
-                'medium': '🟡', 
-                'low': '🟢'
-            }.get(alert['severity'], '⚪')
-            
-            timestamp_str = alert['timestamp'].strftime('%H:%M:%S')
-            
-            # Create alert container
-            alert_container = st.container()
-            with alert_container:
-                col1, col2 = st.columns([1, 8])
-                with col1:
-                    st.write(severity_color)
-                with col2:
-                    st.write(f"**{timestamp_str}** - {alert['message']}")
-                    st.caption(f"Type: {alert['type']} | Commodity: {alert['commodity']}")
-                
-                st.divider()
+    if not filtered_alerts.empty:
+        severity_colors = {
+            'high': '🔴',
+            'medium': '🟡', 
+            'low': '🟢'
+        }
+        
+        # One markdown block for the whole list instead of a container per alert
+        alert_lines = []
+        for alert in filtered_alerts.head(20).itertuples(index=False):  # Show only last 20 alerts
+            severity_color = severity_colors.get(alert.severity, '⚪')
+            timestamp_str = alert.timestamp.strftime('%H:%M:%S')
+            message = alert.message.replace('$', r'\$')  # Keep prices from rendering as LaTeX
+            alert_lines.append(
+                f"{severity_color} **{timestamp_str}** - {message}  \n"
+                f":gray[Type: {alert.type} | Commodity: {alert.commodity}]"
+            )
+        
+        st.markdown("\n\n---\n\n".join(alert_lines))
     else:
         st.info("No alerts match the current filters")
 else:
@@ -226,48 +242,64 @@ else:
 # Alert Statistics and Trends
 st.subheader("📊 Alert Analytics")
 
-if alert_system.alert_history:
-    # Prepare data for visualization
-    alert_df = pd.DataFrame(alert_system.alert_history)
-    alert_df['date'] = pd.to_datetime(alert_df['timestamp']).dt.date
-    alert_df['hour'] = pd.to_datetime(alert_df['timestamp']).dt.hour
+@st.cache_data(ttl=3600, show_spinner=False)
+def compute_alert_analytics(revision):
+    """Count the last 7 days of alerts by type, severity and day (once per history revision)"""
+    # Columnar alert history, indexed and sorted by timestamp
+    alert_df = alert_system.get_alert_frame()
     
     # Filter to last 7 days
-    recent_date = datetime.now().date() - timedelta(days=7)
-    recent_alerts = alert_df[alert_df['date'] >= recent_date]
+    recent_date = pd.Timestamp(datetime.now().date() - timedelta(days=7))
+    recent_alerts = alert_df.loc[recent_date:]
+    
+    if recent_alerts.empty:
+        return None
     
-    if not recent_alerts.empty:
+    # Drop categories unused this week
+    type_counts = recent_alerts['type'].value_counts()
+    type_counts = type_counts[type_counts > 0]
+    severity_counts = recent_alerts['severity'].value_counts()
+    severity_counts = severity_counts[severity_counts > 0]
+    daily_alerts = recent_alerts.groupby(recent_alerts.index.date).size()
+    
+    return type_counts, severity_counts, daily_alerts
+
+if alert_system.alert_history:
+    alert_analytics = compute_alert_analytics(alert_system.revision)
+    
+    if alert_analytics is not None:
+        # plotly.express is slow to import and only needed once there is history to chart
+        import plotly.express as px
+        
+        type_counts, severity_counts, daily_alerts = alert_analytics
         chart_col1, chart_col2 = st.columns(2)
         
         with chart_col1:
             # Alerts by type
-            type_counts = recent_alerts['type'].value_counts()
             fig_type = px.pie(
-                values=type_counts.values,
-                names=type_counts.index,
+                values=type_counts.to_numpy(),
+                names=type_counts.index.to_numpy(),
                 title="Alerts by Type (Last 7 Days)"
             )
             st.plotly_chart(fig_type, use_container_width=True)
         
         with chart_col2:
             # Alerts by severity
-            severity_counts = recent_alerts['severity'].value_counts()
             colors = {'high': 'red', 'medium': 'orange', 'low': 'green'}
             fig_severity = px.bar(
-                x=severity_counts.index,
-                y=severity_counts.values,
+                x=severity_counts.index.to_numpy(),
+                y=severity_counts.to_numpy(),
                 title="Alerts by Severity (Last 7 Days)",
-                color=severity_counts.index,
+                color=severity_counts.index.to_numpy(),
                 color_discrete_map=colors
             )
             st.plotly_chart(fig_severity, use_container_width=True)
         
         # Daily alert trend
-        daily_alerts = recent_alerts.groupby('date').size().reset_index(name='count')
         fig_daily = px.line(
-            daily_alerts,
-            x='date',
-            y='count',
+            x=daily_alerts.index.to_numpy(),
+            y=daily_alerts.to_numpy(),
+            labels={'x': 'date', 'y': 'count'},
             title="Daily Alert Frequency (Last 7 Days)",
             markers=True
         )
@@ -303,11 +335,26 @@ with st.expander("Test Alert Generation"):
             }
             
             st.session_state.active_alerts.append(test_alert)
+            st.session_state.active_alerts_revision += 1
             st.success("Test alert generated!")
 
 # Alert Export
 st.subheader("📥 Export Alerts")
 
+@st.cache_data(ttl=300, show_spinner=False)
+def build_alerts_csv(revision, days):
+    """Build CSV bytes for the last N days of alert history (once per history revision)"""
+    export_df = alert_system.get_alert_frame()
+    export_df = export_df[export_df.index > datetime.now() - timedelta(days=days)]
+    if export_df.empty:
+        return None
+    
+    # Arrow's C++ CSV writer is much cheaper than DataFrame.to_csv
+    table = pa.Table.from_pandas(export_df.reset_index(), preserve_index=False)
+    buf = pa.BufferOutputStream()
+    pa_csv.write_csv(table, buf)
+    return buf.getvalue().to_pybytes()
+
 export_col1, export_col2 = st.columns(2)
 
 with export_col1:
@@ -318,13 +365,9 @@ with export_col2:
         # Prepare export data
         period_map = {"Last 24 Hours": 1, "Last 7 Days": 7, "Last 30 Days": 30}
         days = period_map[export_period]
-        cutoff_date = datetime.now() - timedelta(days=days)
-        
-        export_alerts = [a for a in alert_system.alert_history if a['timestamp'] > cutoff_date]
+        csv_data = build_alerts_csv(alert_system.revision, days)
         
-        if export_alerts:
-            export_df = pd.DataFrame(export_alerts)
-            csv_data = export_df.to_csv(index=False)
+        if csv_data is not None:
             filename = f"energy_alerts_{export_period.lower().replace(' ', '_')}_{datetime.now().strftime('%Y%m%d')}.csv"
             
             st.download_button(
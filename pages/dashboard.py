@@ -1,3 +0,0 @@
-# This file is imported by app.py for the dashboard page
-# The main dashboard logic is already implemented in app.py
-pass
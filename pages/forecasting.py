@@ -1,20 +1,20 @@
 import streamlit as st
 import pandas as pd
-import plotly.graph_objects as go
 from datetime import datetime, timedelta
 import numpy as np
+import os
+import io
 
 st.title("🔮 Energy Price Forecasting")
 st.markdown("AI-powered price prediction using machine learning models")
 
-# Import required modules
-from utils.api_clients import EnergyDataAPI
-from utils.forecasting import EnergyForecasting
-from utils.data_processor import DataProcessor
+# Shared services, built once per server rather than on every rerun
+from utils.services import get_services, get_forecasting, load_price_history, COMMODITY_COLUMNS
 
-api_client = EnergyDataAPI()
-forecasting = EnergyForecasting()
-data_processor = DataProcessor()
+api_client, data_processor, _ = get_services()
+forecasting = get_forecasting()
+
+DEBUG = os.getenv("DEBUG", "False").lower() == "true"
 
 # Forecasting parameters
 st.subheader("Forecasting Parameters")
@@ -48,23 +48,22 @@ with col4:
         index=1
     )
 
-# Load data for forecasting
-@st.cache_data(ttl=1800)
+# Load data for forecasting (one cached fetch backs every training period)
 def load_forecasting_data(period):
     period_map = {"3 Months": 90, "6 Months": 180, "1 Year": 365}
     days = period_map[period]
     
-    oil_data = api_client.get_oil_prices()
-    gas_data = api_client.get_natural_gas_prices()
+    oil_data, gas_data = load_price_history()
     
     # Trim to requested period
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
     
+    # Sorted index, so this is a binary-search slice rather than a full mask
     if oil_data is not None:
-        oil_data = oil_data[oil_data.index >= start_date]
+        oil_data = oil_data.loc[start_date:]
     if gas_data is not None:
-        gas_data = gas_data[gas_data.index >= start_date]
+        gas_data = gas_data.loc[start_date:]
     
     return oil_data, gas_data
 
@@ -74,38 +73,35 @@ if st.button("🔮 Generate Forecast", type="primary"):
         # Load data
         oil_data, gas_data = load_forecasting_data(training_period)
         
-        # Debug information
-        st.write("**Debug Information:**")
-        if oil_data is not None:
-            st.write(f"Oil data shape: {oil_data.shape}")
-            st.write(f"Oil data columns: {list(oil_data.columns)}")
-            st.write(f"Oil data date range: {oil_data.index.min()} to {oil_data.index.max()}")
-        else:
-            st.write("Oil data: None")
-            
-        if gas_data is not None:
-            st.write(f"Gas data shape: {gas_data.shape}")
-            st.write(f"Gas data date range: {gas_data.index.min()} to {gas_data.index.max()}")
-        else:
-            st.write("Gas data: None")
+        # Debug information (only when DEBUG is set; each write is a frontend round trip)
+        if DEBUG:
+            st.write("**Debug Information:**")
+            if oil_data is not None:
+                st.write(f"Oil data shape: {oil_data.shape}")
+                st.write(f"Oil data columns: {list(oil_data.columns)}")
+                st.write(f"Oil data date range: {oil_data.index.min()} to {oil_data.index.max()}")
+            else:
+                st.write("Oil data: None")
+                
+            if gas_data is not None:
+                st.write(f"Gas data shape: {gas_data.shape}")
+                st.write(f"Gas data date range: {gas_data.index.min()} to {gas_data.index.max()}")
+            else:
+                st.write("Gas data: None")
         
         # Select appropriate price series
-        if commodity == "WTI Crude" and oil_data is not None and 'WTI' in oil_data.columns:
-            price_series = oil_data['WTI'].dropna()
-            st.write(f"WTI price series length: {len(price_series)}")
-        elif commodity == "Brent Crude" and oil_data is not None and 'Brent' in oil_data.columns:
-            price_series = oil_data['Brent'].dropna()
-            st.write(f"Brent price series length: {len(price_series)}")
-        elif commodity == "Natural Gas" and gas_data is not None and 'Price' in gas_data.columns:
-            price_series = gas_data['Price'].dropna()
-            st.write(f"Natural Gas price series length: {len(price_series)}")
+        source, column = COMMODITY_COLUMNS[commodity]
+        price_frame = oil_data if source == "oil" else gas_data
+        if price_frame is not None and column in price_frame.columns:
+            price_series = price_frame[column].dropna()
         else:
             price_series = None
             st.error(f"No data available for {commodity}")
         
         if price_series is not None:
-            st.write(f"Selected price series has {len(price_series)} data points")
-            if len(price_series) >= 30:
+            if DEBUG:
+                st.write(f"Selected price series has {price_series.size} data points")
+            if price_series.size >= 30:
                 # Train model
                 model_type_map = {"Random Forest": "random_forest", "Linear Regression": "linear_regression"}
                 model_info = forecasting.train_model(price_series, model_type_map[model_type])
@@ -118,195 +114,170 @@ if st.button("🔮 Generate Forecast", type="primary"):
                         # Add prediction intervals
                         forecast_df = forecasting.calculate_prediction_intervals(forecast_df)
                         
-                        # Store results in session state
+                        # Store results in session state as plain arrays; every rerun
+                        # reads them, and numpy reductions skip pandas overhead
+                        has_bounds = 'upper_bound' in forecast_df.columns and 'lower_bound' in forecast_df.columns
                         st.session_state.forecast_results = {
                             'commodity': commodity,
-                            'price_series': price_series,
-                            'forecast_df': forecast_df,
+                            'hist_x': price_series.index.to_numpy(),
+                            'hist_y': price_series.to_numpy(),
+                            'fc_x': forecast_df.index.to_numpy(),
+                            'fc_y': forecast_df['forecast'].to_numpy(),
+                            'fc_upper': forecast_df['upper_bound'].to_numpy() if has_bounds else None,
+                            'fc_lower': forecast_df['lower_bound'].to_numpy() if has_bounds else None,
                             'model_info': model_info,
                             'model_type': model_type
                         }
                         
+                        st.session_state.pop('forecast_fig', None)
+                        
                         st.success("Forecast generated successfully!")
                     else:
                         st.error("Failed to generate forecast")
                 else:
                     st.error("Failed to train forecasting model")
             else:
-                st.error(f"Insufficient data for forecasting. Need at least 30 data points, but only have {len(price_series)}")
+                st.error(f"Insufficient data for forecasting. Need at least 30 data points, but only have {price_series.size}")
         else:
             st.error("No price series data available")
 
 # Display forecast results
 if 'forecast_results' in st.session_state:
     results = st.session_state.forecast_results
+    hist_x, hist_y = results['hist_x'], results['hist_y']
+    fc_x, fc_y = results['fc_x'], results['fc_y']
+    fc_upper, fc_lower = results['fc_upper'], results['fc_lower']
     
     st.subheader(f"📊 {results['commodity']} Price Forecast")
     
     # Model performance metrics
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.metric(
-            "Model Type",
-            results['model_type']
-        )
-    
-    with col2:
-        train_score = results['model_info'].get('train_score', 0)
-        st.metric(
-            "Training R²",
-            f"{train_score:.3f}"
-        )
-    
-    with col3:
-        test_score = results['model_info'].get('test_score', 0)
-        st.metric(
-            "Test R²",
-            f"{test_score:.3f}"
-        )
-    
-    with col4:
-        test_mae = results['model_info'].get('test_mae', 0)
-        st.metric(
-            "Test MAE",
-            f"${test_mae:.2f}"
+    train_score = results['model_info'].get('train_score', 0)
+    test_score = results['model_info'].get('test_score', 0)
+    test_mae = results['model_info'].get('test_mae', 0)
+    
+    metric_cols = st.columns(4)
+    metric_cols[0].metric("Model Type", results['model_type'])
+    metric_cols[1].metric("Training R²", f"{train_score:.3f}")
+    metric_cols[2].metric("Test R²", f"{test_score:.3f}")
+    metric_cols[3].metric("Test MAE", f"${test_mae:.2f}")
+    
+    # Forecast visualization, rebuilt only for a new forecast or period; other
+    # widget reruns reuse the figure kept in session state
+    historical_x, historical_y = hist_x[-60:], hist_y[-60:]  # Show last 60 days
+    fig_key = (id(results), forecast_days)
+    cached_fig = st.session_state.get('forecast_fig')
+    
+    if cached_fig is None or cached_fig[0] != fig_key:
+        # Plotly is only needed when there is a figure to build
+        import plotly.graph_objects as go
+        
+        # Historical prices and forecast
+        traces = [
+            go.Scatter(
+                x=historical_x,
+                y=historical_y,
+                mode='lines',
+                name='Historical Prices',
+                line=dict(color='blue', width=2)
+            ),
+            go.Scatter(
+                x=fc_x,
+                y=fc_y,
+                mode='lines',
+                name='Forecast',
+                line=dict(color='red', width=2, dash='dash')
+            )
+        ]
+        
+        # Prediction intervals
+        if fc_upper is not None and fc_lower is not None:
+            traces.append(go.Scatter(
+                x=fc_x,
+                y=fc_upper,
+                mode='lines',
+                name='Upper Bound (95%)',
+                line=dict(color='red', width=1),
+                opacity=0.3
+            ))
+            
+            traces.append(go.Scatter(
+                x=fc_x,
+                y=fc_lower,
+                mode='lines',
+                name='Lower Bound (95%)',
+                line=dict(color='red', width=1),
+                opacity=0.3,
+                fill='tonexty',
+                fillcolor='rgba(255,0,0,0.1)'
+            ))
+        
+        # Add a visual separator between historical and forecast data
+        # Use a shape instead of vline to avoid compatibility issues
+        last_historical_date = pd.Timestamp(historical_x[-1])
+        
+        fig = go.Figure(
+            data=traces,
+            layout=go.Layout(
+                title=f"{results['commodity']} Price Forecast ({forecast_days} days)",
+                xaxis_title="Date",
+                yaxis_title="Price (USD)",
+                height=500,
+                hovermode='x unified',
+                shapes=[dict(
+                    type="line",
+                    x0=last_historical_date,
+                    x1=last_historical_date,
+                    y0=0,
+                    y1=1,
+                    yref="paper",
+                    line=dict(color="gray", width=2, dash="dot")
+                )],
+                annotations=[dict(
+                    x=last_historical_date,
+                    y=0.9,
+                    yref="paper",
+                    text="Forecast Start",
+                    showarrow=False,
+                    font=dict(color="gray")
+                )]
+            )
         )
-    
-    # Forecast visualization
-    fig = go.Figure()
-    
-    # Historical prices
-    historical_data = results['price_series'].tail(60)  # Show last 60 days
-    fig.add_trace(go.Scatter(
-        x=historical_data.index,
-        y=historical_data.values,
-        mode='lines',
-        name='Historical Prices',
-        line=dict(color='blue', width=2)
-    ))
-    
-    # Forecast
-    forecast_df = results['forecast_df']
-    fig.add_trace(go.Scatter(
-        x=forecast_df.index,
-        y=forecast_df['forecast'],
-        mode='lines',
-        name='Forecast',
-        line=dict(color='red', width=2, dash='dash')
-    ))
-    
-    # Prediction intervals
-    if 'upper_bound' in forecast_df.columns and 'lower_bound' in forecast_df.columns:
-        fig.add_trace(go.Scatter(
-            x=forecast_df.index,
-            y=forecast_df['upper_bound'],
-            mode='lines',
-            name='Upper Bound (95%)',
-            line=dict(color='red', width=1),
-            opacity=0.3
-        ))
         
-        fig.add_trace(go.Scatter(
-            x=forecast_df.index,
-            y=forecast_df['lower_bound'],
-            mode='lines',
-            name='Lower Bound (95%)',
-            line=dict(color='red', width=1),
-            opacity=0.3,
-            fill='tonexty',
-            fillcolor='rgba(255,0,0,0.1)'
-        ))
-    
-    # Add a visual separator between historical and forecast data
-    # Use a shape instead of vline to avoid compatibility issues
-    last_historical_date = historical_data.index[-1]
-    fig.add_shape(
-        type="line",
-        x0=last_historical_date,
-        x1=last_historical_date,
-        y0=0,
-        y1=1,
-        yref="paper",
-        line=dict(color="gray", width=2, dash="dot"),
-    )
-    fig.add_annotation(
-        x=last_historical_date,
-        y=0.9,
-        yref="paper",
-        text="Forecast Start",
-        showarrow=False,
-        font=dict(color="gray")
-    )
+        st.session_state.forecast_fig = (fig_key, fig)
     
-    fig.update_layout(
-        title=f"{results['commodity']} Price Forecast ({forecast_days} days)",
-        xaxis_title="Date",
-        yaxis_title="Price (USD)",
-        height=500,
-        hovermode='x unified'
-    )
+    fig = st.session_state.forecast_fig[1]
     
     st.plotly_chart(fig, use_container_width=True)
     
     # Forecast summary
     st.subheader("📈 Forecast Summary")
     
-    summary_col1, summary_col2, summary_col3 = st.columns(3)
+    current_price = hist_y[-1]
+    forecast_start_price, forecast_end_price = fc_y[0], fc_y[-1]
+    price_change = forecast_end_price - current_price
+    price_change_pct = (price_change / current_price) * 100
+    forecast_mean = fc_y.mean()
+    forecast_volatility = fc_y.std(ddof=1)
+    historical_volatility = hist_y[-30:].std(ddof=1)
     
-    with summary_col1:
-        current_price = results['price_series'].iloc[-1]
-        forecast_end_price = forecast_df['forecast'].iloc[-1]
-        price_change = forecast_end_price - current_price
-        price_change_pct = (price_change / current_price) * 100
-        
-        st.metric(
-            "Expected Price Change",
-            f"${price_change:+.2f}",
-            f"{price_change_pct:+.1f}%"
-        )
-    
-    with summary_col2:
-        forecast_mean = forecast_df['forecast'].mean()
-        st.metric(
-            "Average Forecast Price",
-            f"${forecast_mean:.2f}"
-        )
-    
-    with summary_col3:
-        forecast_volatility = forecast_df['forecast'].std()
-        st.metric(
-            "Forecast Volatility",
-            f"${forecast_volatility:.2f}"
-        )
+    summary_cols = st.columns(3)
+    summary_cols[0].metric("Expected Price Change", f"${price_change:+.2f}", f"{price_change_pct:+.1f}%")
+    summary_cols[1].metric("Average Forecast Price", f"${forecast_mean:.2f}")
+    summary_cols[2].metric("Forecast Volatility", f"${forecast_volatility:.2f}")
     
     # Key forecast dates and values
     st.subheader("🎯 Key Forecast Points")
     
-    key_points = []
+    # Weekly points that fall inside the forecast, then the end of the forecast
+    weeks = np.array([1, 2, 4])
+    weeks = weeks[weeks * 7 <= len(fc_y)]
+    point_idx = np.append(weeks * 7 - 1, len(fc_y) - 1)
     
-    # Weekly points
-    for weeks in [1, 2, 4]:
-        if weeks * 7 <= len(forecast_df):
-            date_idx = weeks * 7 - 1
-            date = forecast_df.index[date_idx]
-            price = forecast_df['forecast'].iloc[date_idx]
-            key_points.append({
-                'Period': f"{weeks} Week{'s' if weeks > 1 else ''}",
-                'Date': date.strftime('%Y-%m-%d'),
-                'Forecast Price': f"${price:.2f}"
-            })
-    
-    # End of forecast
-    end_date = forecast_df.index[-1]
-    end_price = forecast_df['forecast'].iloc[-1]
-    key_points.append({
-        'Period': f"{forecast_days} Days",
-        'Date': end_date.strftime('%Y-%m-%d'),
-        'Forecast Price': f"${end_price:.2f}"
+    key_points_df = pd.DataFrame({
+        'Period': [f"{w} Week{'s' if w > 1 else ''}" for w in weeks] + [f"{forecast_days} Days"],
+        'Date': np.datetime_as_string(fc_x[point_idx], unit='D'),
+        'Forecast Price': [f"${price:.2f}" for price in fc_y[point_idx]]
     })
-    
-    key_points_df = pd.DataFrame(key_points)
     st.dataframe(key_points_df, use_container_width=True, hide_index=True)
     
     # Model insights
@@ -316,19 +287,16 @@ if 'forecast_results' in st.session_state:
     
     with insight_col1:
         # Price trend analysis
-        if len(forecast_df) > 1:
-            trend_direction = "upward" if forecast_df['forecast'].iloc[-1] > forecast_df['forecast'].iloc[0] else "downward"
+        if fc_y.size > 1:
+            trend_direction = "upward" if forecast_end_price > forecast_start_price else "downward"
             st.info(f"**Trend Direction**: The model predicts an overall {trend_direction} trend over the forecast period.")
         
         # Volatility insight
-        historical_volatility = results['price_series'].tail(30).std()
-        forecast_volatility = forecast_df['forecast'].std()
         volatility_change = "increase" if forecast_volatility > historical_volatility else "decrease"
         st.info(f"**Volatility**: The model expects a {volatility_change} in price volatility compared to recent history.")
     
     with insight_col2:
         # Confidence assessment
-        test_score = results['model_info'].get('test_score', 0)
         if test_score > 0.7:
             confidence = "High"
         elif test_score > 0.4:
@@ -339,8 +307,8 @@ if 'forecast_results' in st.session_state:
         st.info(f"**Model Confidence**: {confidence} (R² = {test_score:.3f})")
         
         # Risk assessment
-        if 'upper_bound' in forecast_df.columns and 'lower_bound' in forecast_df.columns:
-            avg_interval_width = (forecast_df['upper_bound'] - forecast_df['lower_bound']).mean()
+        if fc_upper is not None and fc_lower is not None:
+            avg_interval_width = (fc_upper - fc_lower).mean()
             risk_level = "High" if avg_interval_width > current_price * 0.2 else "Medium" if avg_interval_width > current_price * 0.1 else "Low"
             st.info(f"**Price Risk**: {risk_level} uncertainty in forecasts")
     
@@ -349,17 +317,23 @@ if 'forecast_results' in st.session_state:
     
     if st.button("Export Forecast Data"):
         # Combine historical and forecast data
+        n_hist, n_fc = len(historical_y), len(fc_y)
         export_data = pd.DataFrame({
-            'Date': list(historical_data.index) + list(forecast_df.index),
-            'Type': ['Historical'] * len(historical_data) + ['Forecast'] * len(forecast_df),
-            'Price': list(historical_data.values) + list(forecast_df['forecast'])
+            'Date': np.concatenate([historical_x, fc_x]),
+            'Type': np.repeat(['Historical', 'Forecast'], [n_hist, n_fc]),
+            'Price': np.concatenate([historical_y, fc_y])
         })
         
-        if 'upper_bound' in forecast_df.columns:
-            export_data.loc[export_data['Type'] == 'Forecast', 'Upper_Bound'] = forecast_df['upper_bound'].values
-            export_data.loc[export_data['Type'] == 'Forecast', 'Lower_Bound'] = forecast_df['lower_bound'].values
+        if fc_upper is not None:
+            # Bounds only exist for forecast rows
+            no_bounds = np.full(n_hist, np.nan)
+            export_data['Upper_Bound'] = np.concatenate([no_bounds, fc_upper])
+            export_data['Lower_Bound'] = np.concatenate([no_bounds, fc_lower])
         
-        csv_data = export_data.to_csv(index=False)
+        # Fixed float format and a bytes buffer keep the CSV writer off the repr/encode path
+        csv_buffer = io.BytesIO()
+        export_data.to_csv(csv_buffer, index=False, float_format="%.4f")
+        csv_data = csv_buffer.getvalue()
         filename = f"{results['commodity'].lower().replace(' ', '_')}_forecast_{datetime.now().strftime('%Y%m%d')}.csv"
         
         st.download_button(
@@ -1,7 +1,6 @@
 import streamlit as st
 import pandas as pd
 import plotly.graph_objects as go
-import plotly.express as px
 from datetime import datetime, timedelta
 import numpy as np
 
@@ -9,11 +8,13 @@ st.title("📊 Historical Energy Market Analysis")
 st.markdown("Comprehensive analysis of historical energy price trends and patterns")
 
 # Get data from the main app's API client
-from utils.api_clients import EnergyDataAPI
-from utils.data_processor import DataProcessor
+from utils.services import get_services, load_price_history, COMMODITY_COLUMNS
+from utils.data_processor import rolling_std
 
-api_client = EnergyDataAPI()
-data_processor = DataProcessor()
+api_client, data_processor, _ = get_services()
+
+# Daily standard deviation to annualized volatility in percent (252 trading days)
+ANNUALIZER = float(np.sqrt(252.0) * 100.0)
 
 # Time period selection
 st.subheader("Analysis Parameters")
@@ -43,29 +44,39 @@ with col3:
 period_map = {"30 Days": 30, "90 Days": 90, "1 Year": 365, "2 Years": 730}
 days = period_map[analysis_period]
 
-# Load historical data
-@st.cache_data(ttl=1800)  # Cache for 30 minutes
+# Load historical data (the fetch is cached for 30 minutes; trimming is cheap)
 def load_historical_data(days):
-    oil_data = api_client.get_oil_prices()
-    gas_data = api_client.get_natural_gas_prices()
+    oil_data, gas_data = load_price_history()
     
     # Trim to requested period
     end_date = datetime.now()
     start_date = end_date - timedelta(days=days)
     
+    # Sorted index, so this is a binary-search slice rather than a full mask
     if oil_data is not None:
-        oil_data = oil_data[oil_data.index >= start_date]
+        oil_data = oil_data.loc[start_date:]
     if gas_data is not None:
-        gas_data = gas_data[gas_data.index >= start_date]
+        gas_data = gas_data.loc[start_date:]
     
     return oil_data, gas_data
 
-with st.spinner("Loading historical data..."):
-    oil_data, gas_data = load_historical_data(days)
+# Key a frame on a hash of its index and every value, so an edited row anywhere
+# in the history still rebuilds the chart
+def _frame_key(data):
+    return (
+        tuple(data.columns) if isinstance(data, pd.DataFrame) else data.name,
+        int(pd.util.hash_pandas_object(data).sum())
+    )
 
-if analysis_type == "Price Trends":
-    st.subheader("📈 Price Trend Analysis")
-    
+_figure_cache = st.cache_data(
+    ttl=1800,
+    show_spinner=False,
+    hash_funcs={pd.DataFrame: _frame_key, pd.Series: _frame_key}
+)
+
+@_figure_cache
+def build_trend_figure(oil_data, gas_data, commodities, analysis_period):
+    """Build the price trend chart for the selected commodities"""
     # Create comprehensive price chart
     fig = go.Figure()
     
@@ -113,6 +124,87 @@ if analysis_type == "Price Trends":
         hovermode='x unified'
     )
     
+    return fig
+
+@_figure_cache
+def build_technical_figure(price_data, tech_commodity):
+    """Build the price chart with moving averages and Bollinger bands"""
+    # Calculate technical indicators
+    ma_data = data_processor.calculate_moving_averages(price_data)
+    bollinger_bands = data_processor.calculate_bollinger_bands(price_data)
+    
+    # Plot price with technical indicators
+    traces = [go.Scatter(
+        x=price_data.index,
+        y=price_data,
+        mode='lines',
+        name='Price',
+        line=dict(color='black', width=2)
+    )]
+    
+    # Moving averages
+    if ma_data is not None:
+        for col in ma_data.columns:
+            if col.startswith('MA_'):
+                traces.append(go.Scatter(
+                    x=ma_data.index,
+                    y=ma_data[col],
+                    mode='lines',
+                    name=col,
+                    line=dict(width=1),
+                    opacity=0.7
+                ))
+    
+    # Bollinger bands
+    if bollinger_bands is not None:
+        traces.append(go.Scatter(
+            x=bollinger_bands['upper'].index,
+            y=bollinger_bands['upper'],
+            mode='lines',
+            name='BB Upper',
+            line=dict(color='red', dash='dash'),
+            opacity=0.5
+        ))
+        
+        traces.append(go.Scatter(
+            x=bollinger_bands['lower'].index,
+            y=bollinger_bands['lower'],
+            mode='lines',
+            name='BB Lower',
+            line=dict(color='red', dash='dash'),
+            opacity=0.5,
+            fill='tonexty',
+            fillcolor='rgba(255,0,0,0.1)'
+        ))
+    
+    fig_tech = go.Figure(
+        data=traces,
+        layout=go.Layout(
+            title=f"{tech_commodity} - Technical Analysis",
+            xaxis_title="Date",
+            yaxis_title="Price",
+            height=500
+        )
+    )
+    
+    return fig_tech
+
+with st.spinner("Loading historical data..."):
+    oil_data, gas_data = load_historical_data(days)
+
+# Gap-free price series per commodity, built once and shared by every analysis
+clean_prices = {}
+
+for commodity, (source, column) in COMMODITY_COLUMNS.items():
+    price_frame = oil_data if source == "oil" else gas_data
+    if price_frame is not None and not price_frame.empty and column in price_frame.columns:
+        clean_prices[commodity] = price_frame[column].dropna()
+
+if analysis_type == "Price Trends":
+    st.subheader("📈 Price Trend Analysis")
+    
+    fig = build_trend_figure(oil_data, gas_data, commodities, analysis_period)
+    
     st.plotly_chart(fig, use_container_width=True)
     
     # Price statistics
@@ -120,24 +212,9 @@ if analysis_type == "Price Trends":
     
     stats_data = {}
     
-    if oil_data is not None and not oil_data.empty:
-        for column in ['WTI', 'Brent']:
-            if column in oil_data.columns and f"{column} Crude" in commodities:
-                price_series = oil_data[column].dropna()
-                if not price_series.empty:
-                    stats_data[f"{column} Crude"] = {
-                        'Current': price_series.iloc[-1],
-                        'Average': price_series.mean(),
-                        'Min': price_series.min(),
-                        'Max': price_series.max(),
-                        'Std Dev': price_series.std(),
-                        'Total Return': ((price_series.iloc[-1] / price_series.iloc[0]) - 1) * 100
-                    }
-    
-    if gas_data is not None and not gas_data.empty and "Natural Gas" in commodities:
-        price_series = gas_data['Price'].dropna()
-        if not price_series.empty:
-            stats_data["Natural Gas"] = {
+    for commodity, price_series in clean_prices.items():
+        if commodity in commodities and not price_series.empty:
+            stats_data[commodity] = {
                 'Current': price_series.iloc[-1],
                 'Average': price_series.mean(),
                 'Min': price_series.min(),
@@ -153,24 +230,21 @@ if analysis_type == "Price Trends":
 elif analysis_type == "Volatility Analysis":
     st.subheader("📊 Volatility Analysis")
     
-    # Calculate volatility for each commodity
+    # Collect each commodity with enough history
+    price_data = {
+        commodity: price_series
+        for commodity, price_series in clean_prices.items()
+        if commodity in commodities and len(price_series) > 20
+    }
+    
+    # Calculate volatility for each commodity over its own trading days, so a window
+    # never spans another commodity's dates or depends on which others are selected
     volatility_data = {}
     
-    if oil_data is not None and not oil_data.empty:
-        for column in ['WTI', 'Brent']:
-            if column in oil_data.columns and f"{column} Crude" in commodities:
-                price_series = oil_data[column].dropna()
-                if len(price_series) > 20:
-                    returns = price_series.pct_change().dropna()
-                    volatility = returns.rolling(window=20).std() * np.sqrt(252) * 100
-                    volatility_data[f"{column} Crude"] = volatility
-    
-    if gas_data is not None and not gas_data.empty and "Natural Gas" in commodities:
-        price_series = gas_data['Price'].dropna()
-        if len(price_series) > 20:
-            returns = price_series.pct_change().dropna()
-            volatility = returns.rolling(window=20).std() * np.sqrt(252) * 100
-            volatility_data["Natural Gas"] = volatility
+    for commodity, price_series in price_data.items():
+        returns = price_series.pct_change().iloc[1:]
+        volatility = rolling_std(returns.to_numpy(), window=20) * ANNUALIZER
+        volatility_data[commodity] = pd.Series(volatility, index=returns.index, name=commodity)
     
     if volatility_data:
         # Plot volatility
@@ -224,21 +298,20 @@ elif analysis_type == "Correlation Analysis":
     st.subheader("🔗 Correlation Analysis")
     
     # Prepare data for correlation analysis
-    correlation_data = {}
-    
-    if oil_data is not None and not oil_data.empty:
-        for column in ['WTI', 'Brent']:
-            if column in oil_data.columns:
-                correlation_data[f"{column} Crude"] = oil_data[column]
-    
-    if gas_data is not None and not gas_data.empty:
-        correlation_data["Natural Gas"] = gas_data['Price']
+    correlation_data = clean_prices
     
     if len(correlation_data) >= 2:
-        # Create correlation matrix
-        corr_df = pd.DataFrame(correlation_data).corr()
+        # Create correlation matrix from the aligned price table in one call
+        aligned_data = pd.concat(correlation_data, axis=1).dropna()
+        corr_df = pd.DataFrame(
+            np.corrcoef(aligned_data.to_numpy(), rowvar=False),
+            index=aligned_data.columns,
+            columns=aligned_data.columns
+        )
+        
+        # Plot correlation heatmap (plotly.express is only needed for this view)
+        import plotly.express as px
         
-        # Plot correlation heatmap
         fig_corr = px.imshow(
             corr_df,
             text_auto=True,
@@ -254,7 +327,6 @@ elif analysis_type == "Correlation Analysis":
             commodities_list = list(correlation_data.keys())
             
             # Calculate rolling correlation
-            aligned_data = pd.DataFrame(correlation_data).dropna()
             if len(aligned_data) > 30:
                 rolling_corr = aligned_data.iloc[:, 0].rolling(window=30).corr(aligned_data.iloc[:, 1])
                 
@@ -287,103 +359,37 @@ elif analysis_type == "Technical Analysis":
     )
     
     # Get appropriate data
-    if tech_commodity == "WTI Crude" and oil_data is not None and 'WTI' in oil_data.columns:
-        price_data = oil_data['WTI'].dropna()
-    elif tech_commodity == "Brent Crude" and oil_data is not None and 'Brent' in oil_data.columns:
-        price_data = oil_data['Brent'].dropna()
-    elif tech_commodity == "Natural Gas" and gas_data is not None:
-        price_data = gas_data['Price'].dropna()
-    else:
-        price_data = None
+    price_data = clean_prices.get(tech_commodity)
     
     if price_data is not None and len(price_data) >= 50:
         # Calculate technical indicators
-        ma_data = data_processor.calculate_moving_averages(price_data)
-        bollinger_bands = data_processor.calculate_bollinger_bands(price_data)
         rsi = data_processor.calculate_rsi(price_data)
         
-        # Plot price with technical indicators
-        fig_tech = go.Figure()
-        
-        # Price
-        fig_tech.add_trace(go.Scatter(
-            x=price_data.index,
-            y=price_data,
-            mode='lines',
-            name='Price',
-            line=dict(color='black', width=2)
-        ))
-        
-        # Moving averages
-        if ma_data is not None:
-            for col in ma_data.columns:
-                if col.startswith('MA_'):
-                    fig_tech.add_trace(go.Scatter(
-                        x=ma_data.index,
-                        y=ma_data[col],
-                        mode='lines',
-                        name=col,
-                        line=dict(width=1),
-                        opacity=0.7
-                    ))
-        
-        # Bollinger bands
-        if bollinger_bands is not None:
-            fig_tech.add_trace(go.Scatter(
-                x=bollinger_bands['upper'].index,
-                y=bollinger_bands['upper'],
-                mode='lines',
-                name='BB Upper',
-                line=dict(color='red', dash='dash'),
-                opacity=0.5
-            ))
-            
-            fig_tech.add_trace(go.Scatter(
-                x=bollinger_bands['lower'].index,
-                y=bollinger_bands['lower'],
-                mode='lines',
-                name='BB Lower',
-                line=dict(color='red', dash='dash'),
-                opacity=0.5,
-                fill='tonexty',
-                fillcolor='rgba(255,0,0,0.1)'
-            ))
-        
-        fig_tech.update_layout(
-            title=f"{tech_commodity} - Technical Analysis",
-            xaxis_title="Date",
-            yaxis_title="Price",
-            height=500
-        )
+        fig_tech = build_technical_figure(price_data, tech_commodity)
         
         st.plotly_chart(fig_tech, use_container_width=True)
         
         # Technical indicators summary
-        col1, col2, col3 = st.columns(3)
+        indicator_cols = st.columns(3)
         
-        with col1:
-            if rsi is not None:
-                rsi_signal = "Overbought" if rsi > 70 else "Oversold" if rsi < 30 else "Neutral"
-                st.metric("RSI", f"{rsi:.1f}", rsi_signal)
+        if rsi is not None:
+            rsi_signal = "Overbought" if rsi > 70 else "Oversold" if rsi < 30 else "Neutral"
+            indicator_cols[0].metric("RSI", f"{rsi:.1f}", rsi_signal)
         
-        with col2:
-            volatility = data_processor.calculate_volatility(price_data)
-            if volatility is not None:
-                st.metric("Volatility", f"{volatility:.1%}")
+        volatility = data_processor.calculate_volatility(price_data)
+        if volatility is not None:
+            indicator_cols[1].metric("Volatility", f"{volatility:.1%}")
         
-        with col3:
-            trend = data_processor.detect_trend(price_data)
-            st.metric("Trend", trend)
+        trend = data_processor.detect_trend(price_data)
+        indicator_cols[2].metric("Trend", trend)
         
         # Support and resistance levels
         support, resistance = data_processor.calculate_support_resistance(price_data)
         if support is not None and resistance is not None:
             st.subheader("Support & Resistance Levels")
-            col1, col2 = st.columns(2)
-            with col1:
-                st.metric("Support Level", f"${support:.2f}")
-            with col2:
-                st.metric("Resistance Level", f"${resistance:.2f}")
+            level_cols = st.columns(2)
+            level_cols[0].metric("Support Level", f"${support:.2f}")
+            level_cols[1].metric("Resistance Level", f"${resistance:.2f}")
 
 # Export functionality
 st.subheader("📥 Export Data")
@@ -0,0 +1,30 @@
+import numpy as np
+import pandas as pd
+
+from utils.data_processor import DataProcessor
+
+
+def test_detect_trend_flat_series_is_sideways():
+    processor = DataProcessor()
+    for price in [46.81, 88.8, 65.43, 2.345]:
+        rising_then_flat = pd.Series(np.r_[np.linspace(price / 2, price, 20), np.full(15, price)])
+        assert processor.detect_trend(rising_then_flat) == "Sideways"
+
+
+def test_detect_trend_direction():
+    processor = DataProcessor()
+    assert processor.detect_trend(pd.Series(np.linspace(50.0, 60.0, 30))) == "Uptrend"
+    assert processor.detect_trend(pd.Series(np.linspace(60.0, 50.0, 30))) == "Downtrend"
+
+
+def test_market_summary_flat_series_is_sideways():
+    processor = DataProcessor()
+    dates = pd.bdate_range('2024-01-01', periods=40)
+    oil = pd.DataFrame({'WTI': np.r_[np.linspace(40.0, 46.81, 25), np.full(15, 46.81)]}, index=dates)
+    gas = pd.DataFrame({'Price': np.r_[np.linspace(2.0, 2.345, 25), np.full(15, 2.345)]}, index=dates)
+    
+    summary = processor.generate_market_summary(oil, gas)
+    
+    assert summary['oil_analysis']['WTI']['trend'] == "Sideways"
+    assert summary['gas_analysis']['trend'] == "Sideways"
+    assert summary['market_sentiment'] == "Neutral"
@@ -1,14 +1,58 @@
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
+from collections import deque, Counter
+from bisect import bisect_right
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 import streamlit as st
 
+from utils.data_processor import rolling_std
+
+# Column dtypes for alert history frames
+ALERT_FRAME_DTYPES = {
+    'type': 'category',
+    'severity': 'category',
+    'commodity': 'category',
+    'message': 'string[pyarrow]',
+    'value': 'float64'
+}
+
+class AlertBuffer:
+    """Bounded alert history stored as one column per alert field, oldest first"""
+    
+    fields = ['type', 'severity', 'commodity', 'message', 'timestamp', 'value']
+    
+    def __init__(self, maxlen=1000):
+        # One deque per field instead of a dict per alert; all share maxlen so they stay aligned
+        self.columns = {field: deque(maxlen=maxlen) for field in self.fields}
+    
+    def __len__(self):
+        return len(self.columns['timestamp'])
+    
+    def __iter__(self):
+        """Iterate alerts as dicts, oldest first"""
+        for row in zip(*self.columns.values()):
+            yield dict(zip(self.fields, row))
+    
+    def extend(self, alerts):
+        """Append alerts, dropping the oldest past maxlen"""
+        for field, column in self.columns.items():
+            column.extend(alert[field] for alert in alerts)
+    
+    def tail(self, field, count):
+        """Iterate the newest `count` values of a field, newest first"""
+        return islice(reversed(self.columns[field]), count)
+
 class AlertSystem:
     """System for generating energy market alerts"""
     
     def __init__(self):
-        self.alert_history = []
+        self.alert_history = AlertBuffer(maxlen=1000)  # Keep only recent alerts (last 1000)
         self.alert_rules = self._initialize_default_rules()
+        self.revision = 0  # Bumped whenever alert_history changes
+        self._alert_frame = None
     
     def _initialize_default_rules(self):
         """Initialize default alert rules"""
@@ -22,16 +66,26 @@ class AlertSystem:
             'moving_average_cross': True    # Alert on moving average crossovers
         }
     
-    def check_price_alerts(self, price_data, commodity_name):
+    def _report_error(self, message, errors=None):
+        """Show an error, or collect it when checks run off the script thread"""
+        if errors is None:
+            st.error(message)
+        else:
+            errors.append(message)
+    
+    def check_price_alerts(self, price_data, commodity_name, now=None, errors=None):
         """Check for price-based alerts"""
         alerts = []
+        now = now or datetime.now()  # One timestamp for every alert in a batch
         
         if price_data is None or price_data.empty or len(price_data) < 2:
             return alerts
         
         try:
-            current_price = price_data.iloc[-1]
-            previous_price = price_data.iloc[-2]
+            # Everything below reads the last 30 prices, so slice them out once
+            recent_prices = price_data.to_numpy(dtype=np.float64)[-30:]
+            current_price = recent_prices[-1]
+            previous_price = recent_prices[-2]
             
             # Calculate price change
             price_change = ((current_price - previous_price) / previous_price) * 100
@@ -44,13 +98,13 @@ class AlertSystem:
                     'severity': 'high' if abs(price_change) >= 10 else 'medium',
                     'commodity': commodity_name,
                     'message': f"{commodity_name} {direction} by {abs(price_change):.2f}% to ${current_price:.2f}",
-                    'timestamp': datetime.now(),
+                    'timestamp': now,
                     'value': price_change
                 })
             
             # Check for significant price levels
-            recent_high = price_data.tail(30).max()
-            recent_low = price_data.tail(30).min()
+            recent_high = np.nanmax(recent_prices)
+            recent_low = np.nanmin(recent_prices)
             
             if current_price >= recent_high * 0.99:  # Within 1% of recent high
                 alerts.append({
@@ -58,7 +112,7 @@ class AlertSystem:
                     'severity': 'medium',
                     'commodity': commodity_name,
                     'message': f"{commodity_name} approaching 30-day high at ${current_price:.2f}",
-                    'timestamp': datetime.now(),
+                    'timestamp': now,
                     'value': current_price
                 })
             
@@ -68,32 +122,29 @@ class AlertSystem:
                     'severity': 'medium',
                     'commodity': commodity_name,
                     'message': f"{commodity_name} approaching 30-day low at ${current_price:.2f}",
-                    'timestamp': datetime.now(),
+                    'timestamp': now,
                     'value': current_price
                 })
             
         except Exception as e:
-            st.error(f"Error checking price alerts for {commodity_name}: {str(e)}")
+            self._report_error(f"Error checking price alerts for {commodity_name}: {str(e)}", errors)
         
         return alerts
     
-    def check_volatility_alerts(self, price_data, commodity_name):
+    def check_volatility_alerts(self, price_data, commodity_name, indicators=None, now=None, errors=None):
         """Check for volatility-based alerts"""
         alerts = []
+        now = now or datetime.now()  # One timestamp for every alert in a batch
         
         if price_data is None or price_data.empty or len(price_data) < 20:
             return alerts
         
         try:
-            # Calculate rolling volatility
-            returns = price_data.pct_change().dropna()
-            volatility = returns.rolling(window=20).std() * np.sqrt(252)  # Annualized
-            
-            if volatility.empty:
-                return alerts
+            if indicators is None:
+                indicators = self._compute_indicators(price_data)
             
-            current_volatility = volatility.iloc[-1]
-            avg_volatility = volatility.mean()
+            current_volatility = indicators['volatility']
+            avg_volatility = indicators['avg_volatility']
             
             # High volatility alert
             if current_volatility > self.alert_rules['volatility_threshold']:
@@ -102,25 +153,29 @@ class AlertSystem:
                     'severity': 'high' if current_volatility > 0.5 else 'medium',
                     'commodity': commodity_name,
                     'message': f"{commodity_name} showing high volatility: {current_volatility:.2%} (avg: {avg_volatility:.2%})",
-                    'timestamp': datetime.now(),
+                    'timestamp': now,
                     'value': current_volatility
                 })
             
         except Exception as e:
-            st.error(f"Error checking volatility alerts for {commodity_name}: {str(e)}")
+            self._report_error(f"Error checking volatility alerts for {commodity_name}: {str(e)}", errors)
         
         return alerts
     
-    def check_technical_alerts(self, price_data, commodity_name):
+    def check_technical_alerts(self, price_data, commodity_name, indicators=None, now=None, errors=None):
         """Check for technical analysis alerts"""
         alerts = []
+        now = now or datetime.now()  # One timestamp for every alert in a batch
         
         if price_data is None or price_data.empty or len(price_data) < 50:
             return alerts
         
         try:
+            if indicators is None:
+                indicators = self._compute_indicators(price_data)
+            
             # RSI alerts
-            rsi = self._calculate_rsi(price_data)
+            rsi = indicators['rsi']
             if rsi is not None:
                 if rsi >= self.alert_rules['rsi_overbought']:
                     alerts.append({
@@ -128,7 +183,7 @@ class AlertSystem:
                         'severity': 'medium',
                         'commodity': commodity_name,
                         'message': f"{commodity_name} RSI indicates overbought condition: {rsi:.1f}",
-                        'timestamp': datetime.now(),
+                        'timestamp': now,
                         'value': rsi
                     })
                 elif rsi <= self.alert_rules['rsi_oversold']:
@@ -137,86 +192,136 @@ class AlertSystem:
                         'severity': 'medium',
                         'commodity': commodity_name,
                         'message': f"{commodity_name} RSI indicates oversold condition: {rsi:.1f}",
-                        'timestamp': datetime.now(),
+                        'timestamp': now,
                         'value': rsi
                     })
             
             # Moving average crossover alerts
             if self.alert_rules['moving_average_cross']:
-                ma_alerts = self._check_ma_crossover(price_data, commodity_name)
+                ma_alerts = self._check_ma_crossover(price_data, commodity_name, indicators, now)
                 alerts.extend(ma_alerts)
             
             # Bollinger Band alerts
             if self.alert_rules['bollinger_band_breach']:
-                bb_alerts = self._check_bollinger_bands(price_data, commodity_name)
+                bb_alerts = self._check_bollinger_bands(price_data, commodity_name, indicators, now)
                 alerts.extend(bb_alerts)
             
         except Exception as e:
-            st.error(f"Error checking technical alerts for {commodity_name}: {str(e)}")
+            self._report_error(f"Error checking technical alerts for {commodity_name}: {str(e)}", errors)
         
         return alerts
     
     def _calculate_rsi(self, price_data, window=14):
         """Calculate RSI"""
         try:
-            delta = price_data.diff()
-            gain = (delta.where(delta > 0, 0)).rolling(window=window).mean()
-            loss = (-delta.where(delta < 0, 0)).rolling(window=window).mean()
-            
-            rs = gain / loss
-            rsi = 100 - (100 / (1 + rs))
-            
-            return rsi.iloc[-1] if not rsi.empty else None
+            prices = price_data.to_numpy(dtype=np.float64)
+            if len(prices) < window:
+                return np.nan
+            return self._latest_rsi(prices, window)
         except:
             return None
     
-    def _check_ma_crossover(self, price_data, commodity_name):
+    def _latest_rsi(self, prices, window=14):
+        """Latest RSI down the time axis of a (T,) or (T, C) price array"""
+        # Only the latest RSI is used, and its rolling means cover just the
+        # last `window` price changes, so work on that tail alone.
+        # Dividing by window (not the count) treats the missing first change as 0, like pandas
+        delta = np.diff(prices[-(window + 1):], axis=0)
+        
+        # Gains and losses from the net and absolute moves, so no masked copies are built
+        net_move = delta.sum(axis=0)
+        total_move = np.abs(delta).sum(axis=0)
+        gain = (total_move + net_move) / (2 * window)
+        loss = (total_move - net_move) / (2 * window)
+        
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = gain / loss
+        return 100 - (100 / (1 + rs))
+    
+    def _compute_indicators(self, price_data):
+        """Compute the rolling indicators shared by the volatility and technical checks"""
+        return self._compute_indicator_table(price_data.to_frame())[0]
+    
+    def _compute_indicator_table(self, price_frame):
+        """Compute alert indicators for every column of a gap-free price frame at once"""
+        # (T, C) array, so each indicator is one vectorized pass down the time axis
+        prices = price_frame.to_numpy(dtype=np.float64)
+        n, n_cols = prices.shape
+        table = {
+            key: np.full(n_cols, np.nan)
+            for key in ['rsi', 'ma_short', 'ma_short_prev', 'ma_long', 'ma_long_prev', 'bb_std', 'volatility', 'avg_volatility']
+        }
+        
+        if n >= 14:
+            table['rsi'] = self._latest_rsi(prices, 14)
+        
+        # Crossovers only compare the latest two 10- and 20-day averages, so average those tails alone
+        for key, window in (('ma_short', 10), ('ma_long', 20)):
+            if n >= window:
+                table[key] = prices[-window:].mean(axis=0)
+                if n > window:
+                    table[f'{key}_prev'] = prices[-window - 1:-1].mean(axis=0)
+        
+        if n >= 20:
+            # Bollinger bands only need the latest 20-day spread
+            table['bb_std'] = prices[-20:].std(axis=0, ddof=1)
+        
+        # Annualized 20-day rolling volatility of daily returns
+        returns = prices[1:] / prices[:-1] - 1
+        if len(returns) >= 20:
+            # Running-sum rolling std, so no (windows x 20) block is materialized
+            volatility = rolling_std(returns, 20)[19:] * np.sqrt(252)
+            table['volatility'] = volatility[-1]
+            table['avg_volatility'] = volatility.mean(axis=0)
+        
+        return [{key: values[i] for key, values in table.items()} for i in range(n_cols)]
+    
+    def _check_ma_crossover(self, price_data, commodity_name, indicators=None, now=None):
         """Check for moving average crossover"""
         alerts = []
+        now = now or datetime.now()  # One timestamp for every alert in a batch
         
         try:
             if len(price_data) < 50:
                 return alerts
             
-            ma_short = price_data.rolling(window=10).mean()
-            ma_long = price_data.rolling(window=20).mean()
+            if indicators is None:
+                indicators = self._compute_indicators(price_data)
             
             # Check for recent crossover
-            if len(ma_short) >= 2 and len(ma_long) >= 2:
-                current_position = ma_short.iloc[-1] > ma_long.iloc[-1]
-                previous_position = ma_short.iloc[-2] > ma_long.iloc[-2]
-                
-                if current_position != previous_position:
-                    direction = "bullish" if current_position else "bearish"
-                    alerts.append({
-                        'type': 'technical_ma_cross',
-                        'severity': 'medium',
-                        'commodity': commodity_name,
-                        'message': f"{commodity_name} moving average crossover signals {direction} trend",
-                        'timestamp': datetime.now(),
-                        'value': 1 if current_position else -1
-                    })
+            current_position = indicators['ma_short'] > indicators['ma_long']
+            previous_position = indicators['ma_short_prev'] > indicators['ma_long_prev']
+            
+            if current_position != previous_position:
+                direction = "bullish" if current_position else "bearish"
+                alerts.append({
+                    'type': 'technical_ma_cross',
+                    'severity': 'medium',
+                    'commodity': commodity_name,
+                    'message': f"{commodity_name} moving average crossover signals {direction} trend",
+                    'timestamp': now,
+                    'value': 1 if current_position else -1
+                })
         except:
             pass
         
         return alerts
     
-    def _check_bollinger_bands(self, price_data, commodity_name):
+    def _check_bollinger_bands(self, price_data, commodity_name, indicators=None, now=None):
         """Check for Bollinger Band breaches"""
         alerts = []
+        now = now or datetime.now()  # One timestamp for every alert in a batch
         
         try:
             if len(price_data) < 20:
                 return alerts
             
-            ma = price_data.rolling(window=20).mean()
-            std = price_data.rolling(window=20).std()
-            upper_band = ma + (std * 2)
-            lower_band = ma - (std * 2)
+            if indicators is None:
+                indicators = self._compute_indicators(price_data)
             
             current_price = price_data.iloc[-1]
-            current_upper = upper_band.iloc[-1]
-            current_lower = lower_band.iloc[-1]
+            current_upper = indicators['ma_long'] + (indicators['bb_std'] * 2)
+            current_lower = indicators['ma_long'] - (indicators['bb_std'] * 2)
             
             if current_price > current_upper:
                 alerts.append({
@@ -224,7 +329,7 @@ class AlertSystem:
                     'severity': 'medium',
                     'commodity': commodity_name,
                     'message': f"{commodity_name} broke above upper Bollinger Band: ${current_price:.2f} > ${current_upper:.2f}",
-                    'timestamp': datetime.now(),
+                    'timestamp': now,
                     'value': current_price - current_upper
                 })
             elif current_price < current_lower:
@@ -233,7 +338,7 @@ class AlertSystem:
                     'severity': 'medium',
                     'commodity': commodity_name,
                     'message': f"{commodity_name} broke below lower Bollinger Band: ${current_price:.2f} < ${current_lower:.2f}",
-                    'timestamp': datetime.now(),
+                    'timestamp': now,
                     'value': current_lower - current_price
                 })
         except:
@@ -241,9 +346,10 @@ class AlertSystem:
         
         return alerts
     
-    def check_market_correlation_alerts(self, oil_data, gas_data):
+    def check_market_correlation_alerts(self, oil_data, gas_data, now=None):
         """Check for unusual market correlation patterns"""
         alerts = []
+        now = now or datetime.now()  # One timestamp for every alert in a batch
         
         try:
             if oil_data is None or gas_data is None or oil_data.empty or gas_data.empty:
@@ -251,14 +357,21 @@ class AlertSystem:
             
             # Check correlation between oil and gas
             if 'WTI' in oil_data.columns and 'Price' in gas_data.columns:
-                # Align data
-                aligned_data = pd.concat([
-                    oil_data['WTI'].tail(30), 
-                    gas_data['Price'].tail(30)
-                ], axis=1, join='inner')
+                # Align the last 30 points of each on their shared dates
+                oil_tail = oil_data['WTI'].tail(30)
+                gas_tail = gas_data['Price'].tail(30)
+                shared_dates = oil_tail.index.intersection(gas_tail.index)
                 
-                if len(aligned_data) >= 10:
-                    correlation = aligned_data.corr().iloc[0, 1]
+                if len(shared_dates) >= 10:
+                    oil_prices = oil_tail.reindex(shared_dates).to_numpy(dtype=np.float64)
+                    gas_prices = gas_tail.reindex(shared_dates).to_numpy(dtype=np.float64)
+                    valid = ~(np.isnan(oil_prices) | np.isnan(gas_prices))
+                    
+                    # Flat or too-short series give NaN, which trips neither threshold
+                    correlation = np.nan
+                    if valid.sum() >= 2:
+                        with np.errstate(divide='ignore', invalid='ignore'):
+                            correlation = np.corrcoef(oil_prices[valid], gas_prices[valid])[0, 1]
                     
                     # Normal oil-gas correlation is typically positive but moderate
                     if correlation < -0.5:
@@ -267,7 +380,7 @@ class AlertSystem:
                             'severity': 'medium',
                             'commodity': 'Oil-Gas',
                             'message': f"Unusual negative correlation between oil and gas: {correlation:.2f}",
-                            'timestamp': datetime.now(),
+                            'timestamp': now,
                             'value': correlation
                         })
                     elif correlation > 0.9:
@@ -276,7 +389,7 @@ class AlertSystem:
                             'severity': 'low',
                             'commodity': 'Oil-Gas',
                             'message': f"Very high correlation between oil and gas: {correlation:.2f}",
-                            'timestamp': datetime.now(),
+                            'timestamp': now,
                             'value': correlation
                         })
         except Exception as e:
@@ -284,67 +397,114 @@ class AlertSystem:
         
         return alerts
     
+    def _check_commodity(self, price_series, commodity_name, indicators, now):
+        """Run the price, volatility and technical checks for one commodity, returning (alerts, errors)"""
+        alerts = []
+        errors = []  # Reported by the caller, since this may run on a worker thread
+        alerts.extend(self.check_price_alerts(price_series, commodity_name, now, errors))
+        alerts.extend(self.check_volatility_alerts(price_series, commodity_name, indicators, now, errors))
+        alerts.extend(self.check_technical_alerts(price_series, commodity_name, indicators, now, errors))
+        return alerts, errors
+    
     def generate_all_alerts(self, oil_data, gas_data, stock_data=None):
         """Generate all types of alerts"""
         all_alerts = []
+        now = datetime.now()
+        commodity_checks = []  # (price_series, commodity_name, indicators)
         
         # Oil price alerts
         if oil_data is not None and not oil_data.empty:
-            for column in oil_data.columns:
-                price_series = oil_data[column].dropna()
+            oil_columns = [oil_data[column].dropna() for column in oil_data.columns]
+            
+            # A gap-free frame gets every column's indicators in one batch; otherwise
+            # each column has its own dates after dropna and is handled separately
+            if not oil_data.isna().to_numpy().any():
+                oil_indicators = self._compute_indicator_table(oil_data)
+            else:
+                oil_indicators = [
+                    self._compute_indicators(price_series) if not price_series.empty else None
+                    for price_series in oil_columns
+                ]
+            
+            for column, price_series, indicators in zip(oil_data.columns, oil_columns, oil_indicators):
                 if not price_series.empty:
-                    all_alerts.extend(self.check_price_alerts(price_series, column))
-                    all_alerts.extend(self.check_volatility_alerts(price_series, column))
-                    all_alerts.extend(self.check_technical_alerts(price_series, column))
+                    commodity_checks.append((price_series, column, indicators))
         
         # Gas price alerts
         if gas_data is not None and not gas_data.empty and 'Price' in gas_data.columns:
             gas_series = gas_data['Price'].dropna()
             if not gas_series.empty:
-                all_alerts.extend(self.check_price_alerts(gas_series, "Natural Gas"))
-                all_alerts.extend(self.check_volatility_alerts(gas_series, "Natural Gas"))
-                all_alerts.extend(self.check_technical_alerts(gas_series, "Natural Gas"))
+                commodity_checks.append((gas_series, "Natural Gas", self._compute_indicators(gas_series)))
+        
+        # Commodities are independent, so check them side by side; workers only collect
+        # their errors, which are shown here on the script thread, in submission order
+        if commodity_checks:
+            with ThreadPoolExecutor(max_workers=min(8, len(commodity_checks))) as executor:
+                results = executor.map(lambda check: self._check_commodity(*check, now), commodity_checks)
+                for alerts, errors in results:
+                    all_alerts.extend(alerts)
+                    for message in errors:
+                        st.error(message)
         
         # Correlation alerts
-        correlation_alerts = self.check_market_correlation_alerts(oil_data, gas_data)
+        correlation_alerts = self.check_market_correlation_alerts(oil_data, gas_data, now)
         all_alerts.extend(correlation_alerts)
         
-        # Sort alerts by severity and timestamp
-        severity_order = {'high': 0, 'medium': 1, 'low': 2}
-        all_alerts.sort(key=lambda x: (severity_order.get(x['severity'], 3), x['timestamp']), reverse=True)
+        # Sort alerts by severity and timestamp, bucketing by severity instead of a keyed sort;
+        # the order matches the previous reversed sort: unranked, low, medium, then high
+        severity_buckets = {'low': [], 'medium': [], 'high': []}
+        unranked = []
+        for alert in all_alerts:
+            severity_buckets.get(alert['severity'], unranked).append(alert)
         
-        # Store in history
+        all_alerts = []
+        for bucket in (unranked, severity_buckets['low'], severity_buckets['medium'], severity_buckets['high']):
+            bucket.sort(key=itemgetter('timestamp'), reverse=True)
+            all_alerts.extend(bucket)
+        
+        # Store in history (the buffer drops the oldest past 1000)
         self.alert_history.extend(all_alerts)
         
-        # Keep only recent alerts in history (last 1000)
-        if len(self.alert_history) > 1000:
-            self.alert_history = self.alert_history[-1000:]
+        self.revision += 1
         
         return all_alerts
     
+    def get_alert_frame(self):
+        """Get alert history as a DataFrame indexed by timestamp (oldest first)"""
+        if self._alert_frame is None or self._alert_frame[0] != self.revision:
+            # The history is already columnar, so each column is copied straight in
+            columns = self.alert_history.columns
+            alert_df = pd.DataFrame(
+                {field: list(values) for field, values in columns.items() if field != 'timestamp'},
+                index=pd.DatetimeIndex(list(columns['timestamp']), name='timestamp')
+            )
+            # Few distinct values, so integer category codes beat object strings;
+            # messages are Arrow-backed so filtering and CSV export skip Python objects
+            alert_df = alert_df.astype(ALERT_FRAME_DTYPES)
+            self._alert_frame = (self.revision, alert_df.sort_index())
+        
+        return self._alert_frame[1]
+    
     def get_alert_summary(self, hours=24):
         """Get summary of alerts in the last N hours"""
         cutoff_time = datetime.now() - timedelta(hours=hours)
-        recent_alerts = [
-            alert for alert in self.alert_history 
-            if alert['timestamp'] > cutoff_time
-        ]
+        
+        # History is appended a batch at a time with one timestamp per batch, so it is
+        # in time order and a binary search finds where the window starts
+        timestamps = self.alert_history.columns['timestamp']
+        recent_count = len(timestamps) - bisect_right(timestamps, cutoff_time)
+        
+        # Count severities and types over just that window
+        severity_counts = Counter(self.alert_history.tail('severity', recent_count))
         
         summary = {
-            'total_alerts': len(recent_alerts),
-            'high_severity': len([a for a in recent_alerts if a['severity'] == 'high']),
-            'medium_severity': len([a for a in recent_alerts if a['severity'] == 'medium']),
-            'low_severity': len([a for a in recent_alerts if a['severity'] == 'low']),
-            'by_type': {}
+            'total_alerts': recent_count,
+            'high_severity': severity_counts['high'],
+            'medium_severity': severity_counts['medium'],
+            'low_severity': severity_counts['low'],
+            'by_type': dict(Counter(self.alert_history.tail('type', recent_count)))
         }
         
-        # Count by type
-        for alert in recent_alerts:
-            alert_type = alert['type']
-            if alert_type not in summary['by_type']:
-                summary['by_type'][alert_type] = 0
-            summary['by_type'][alert_type] += 1
-        
         return summary
     
     def update_alert_rules(self, new_rules):
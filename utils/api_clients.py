@@ -1,9 +1,55 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import pandas as pd
+import numpy as np
 import yfinance as yf
 import os
 from datetime import datetime, timedelta
+from functools import partial
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import streamlit as st
+from streamlit.runtime.scriptrunner import add_script_run_ctx, get_script_run_ctx
+
+# Cache durations in minutes: market prices go stale within minutes, slower sources keep the default
+CACHE_DURATION = 30
+PRICE_CACHE_DURATION = 5
+
+class FetchError(Exception):
+    """A data source returned nothing usable"""
+
+def _run_fetch(client, fetch_name):
+    """Run one of the client's fetchers, raising FetchError when it comes back empty"""
+    # st.cache_data never stores a raised call, so a failed fetch is retried on the next rerun
+    result = getattr(client, fetch_name)()
+    if result is None:
+        raise FetchError(f"{fetch_name} returned no data")
+    return result
+
+@st.cache_data(ttl=PRICE_CACHE_DURATION * 60, show_spinner=False)
+def _cached_price_fetch(_client, fetch_name, api_key=None):
+    """Run one of the client's market price fetchers, reusing the result across reruns"""
+    return _run_fetch(_client, fetch_name)
+
+@st.cache_data(ttl=CACHE_DURATION * 60, show_spinner=False)
+def _cached_fetch(_client, fetch_name, api_key=None):
+    """Run one of the client's fetchers, reusing the result across reruns"""
+    # The client itself isn't hashed; the fetcher name and API key make the cache key
+    return _run_fetch(_client, fetch_name)
+
+def fetch_concurrently(*loaders):
+    """Run independent data loaders in parallel and return their results in order"""
+    # Worker threads share the script context so caching and st.error calls still work
+    ctx = get_script_run_ctx()
+    
+    def run(loader):
+        add_script_run_ctx(threading.current_thread(), ctx)
+        return loader()
+    
+    with ThreadPoolExecutor(max_workers=len(loaders)) as executor:
+        futures = [executor.submit(run, loader) for loader in loaders]
+        return [future.result() for future in futures]
 
 class EnergyDataAPI:
     """Client for accessing various energy market APIs"""
@@ -20,12 +66,34 @@ class EnergyDataAPI:
         self.fred_base_url = "https://api.stlouisfed.org/fred"
         
         # Cache duration in minutes
-        self.cache_duration = 30
+        self.cache_duration = CACHE_DURATION
+        
+        # Fallback renewable data, built once and handed out as copies
+        self._sample_renewable = pd.DataFrame({
+            'Source': ['Solar', 'Wind', 'Hydro'],
+            'Capacity': [50.0, 120.0, 80.0],  # GW
+            'Generation': [45.0, 95.0, 75.0]  # TWh
+        })
+        
+        # One pooled session, so repeated calls to the same API reuse connections;
+        # rate limits and server errors are retried with exponential backoff
+        self._session = requests.Session()
+        adapter = HTTPAdapter(
+            pool_connections=10,
+            pool_maxsize=20,
+            max_retries=Retry(total=3, backoff_factor=0.3, status_forcelist=[429, 500, 502, 503, 504])
+        )
+        self._session.mount('https://', adapter)
+    
+    def clear_cache(self):
+        """Drop cached market data so the next call fetches fresh"""
+        _cached_price_fetch.clear()
+        _cached_fetch.clear()
     
     def _make_request(self, url, params=None, timeout=10):
         """Make HTTP request with error handling"""
         try:
-            response = requests.get(url, params=params, timeout=timeout)
+            response = self._session.get(url, params=params, timeout=timeout)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -35,218 +103,231 @@ class EnergyDataAPI:
             st.error(f"Unexpected error: {str(e)}")
             return None
     
-    def get_oil_prices(self):
-        """Get WTI and Brent crude oil prices"""
+    def _download_closes(self, tickers, start_date, end_date):
+        """Download closing prices for several tickers in one Yahoo Finance request"""
+        data = yf.download(tickers, start=start_date, end=end_date, progress=False, group_by='ticker')
+        if data is None or data.empty:
+            return pd.DataFrame()
+        
+        # Tickers that failed come back missing or as all-NaN columns
+        downloaded = data.columns.get_level_values(0)
+        closes = pd.DataFrame({
+            ticker: data[ticker]['Close'] for ticker in tickers if ticker in downloaded
+        })
+        return closes.dropna(axis=1, how='all').dropna(how='all')
+    
+    def _fetch_through(self, cached_fetch, fetch_name, description, api_key=None):
+        """Fetch through one of the caches, reporting failures out here so they aren't cached"""
         try:
-            # Use Yahoo Finance for oil prices as it's more reliable and free
-            wti_ticker = "CL=F"  # WTI Crude Oil Futures
-            brent_ticker = "BZ=F"  # Brent Crude Oil Futures
-            
-            # Get more data for forecasting - extend to 1 year to ensure enough data
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=365)
-            
-            wti_data = yf.download(wti_ticker, start=start_date, end=end_date, progress=False)
-            brent_data = yf.download(brent_ticker, start=start_date, end=end_date, progress=False)
-            
-            if (wti_data is None or wti_data.empty) and (brent_data is None or brent_data.empty):
-                return None
-            
-            # Combine data
-            oil_df = pd.DataFrame()
-            if wti_data is not None and not wti_data.empty:
-                oil_df['WTI'] = wti_data['Close']
-            if brent_data is not None and not brent_data.empty:
-                oil_df['Brent'] = brent_data['Close']
-            
-            return oil_df
-            
+            return cached_fetch(self, fetch_name, api_key)
+        except FetchError:
+            return None
         except Exception as e:
-            st.error(f"Error fetching oil prices: {str(e)}")
+            st.error(f"Error fetching {description}: {str(e)}")
+            return None
+    
+    def get_oil_prices(self):
+        """Get WTI and Brent crude oil prices, cached across reruns"""
+        return self._fetch_through(_cached_price_fetch, '_fetch_oil_prices', 'oil prices')
+    
+    def _fetch_oil_prices(self):
+        """Get WTI and Brent crude oil prices"""
+        # Use Yahoo Finance for oil prices as it's more reliable and free
+        wti_ticker = "CL=F"  # WTI Crude Oil Futures
+        brent_ticker = "BZ=F"  # Brent Crude Oil Futures
+        
+        # Get more data for forecasting - extend to 1 year to ensure enough data
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=365)
+        
+        # Both futures in one round trip
+        closes = self._download_closes([wti_ticker, brent_ticker], start_date, end_date)
+        
+        if closes.empty:
             return None
+        
+        # The joint download covers either market's trading days; keep WTI's dates,
+        # with Brent aligned to them, so the latest row has a WTI price
+        if wti_ticker in closes.columns:
+            closes = closes.dropna(subset=[wti_ticker])
+        
+        oil_df = closes.rename(columns={wti_ticker: 'WTI', brent_ticker: 'Brent'})
+        
+        return oil_df
     
     def get_natural_gas_prices(self):
+        """Get natural gas prices, cached across reruns"""
+        return self._fetch_through(_cached_price_fetch, '_fetch_natural_gas_prices', 'natural gas prices')
+    
+    def _fetch_natural_gas_prices(self):
         """Get natural gas prices"""
-        try:
-            # Use Yahoo Finance for natural gas futures
-            ng_ticker = "NG=F"  # Natural Gas Futures
-            
-            # Get more data for forecasting - extend to 1 year
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=365)
-            
-            ng_data = yf.download(ng_ticker, start=start_date, end=end_date, progress=False)
-            
-            if ng_data is None or ng_data.empty:
-                return None
-            
-            ng_df = pd.DataFrame()
-            ng_df['Price'] = ng_data['Close']
-            
-            return ng_df
-            
-        except Exception as e:
-            st.error(f"Error fetching natural gas prices: {str(e)}")
+        # Use Yahoo Finance for natural gas futures
+        ng_ticker = "NG=F"  # Natural Gas Futures
+        
+        # Get more data for forecasting - extend to 1 year
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=365)
+        
+        ng_data = yf.download(ng_ticker, start=start_date, end=end_date, progress=False)
+        
+        if ng_data is None or ng_data.empty:
             return None
+        
+        ng_df = pd.DataFrame()
+        ng_df['Price'] = ng_data['Close']
+        
+        return ng_df
     
     def get_energy_stocks(self):
+        """Get energy sector stock prices, cached across reruns"""
+        return self._fetch_through(_cached_price_fetch, '_fetch_energy_stocks', 'energy stocks')
+    
+    def _fetch_energy_stocks(self):
         """Get energy sector stock prices"""
-        try:
-            # Major energy companies
-            energy_tickers = ["XOM", "CVX", "COP", "EOG", "SLB"]  # ExxonMobil, Chevron, ConocoPhillips, EOG Resources, Schlumberger
-            
-            end_date = datetime.now()
-            start_date = end_date - timedelta(days=30)
-            
-            stock_data = {}
-            for ticker in energy_tickers:
-                try:
-                    data = yf.download(ticker, start=start_date, end=end_date, progress=False)
-                    if not data.empty:
-                        stock_data[ticker] = data['Close']
-                except:
-                    continue
-            
-            if not stock_data:
-                return None
-            
-            return pd.DataFrame(stock_data)
-            
-        except Exception as e:
-            st.error(f"Error fetching energy stocks: {str(e)}")
+        # Major energy companies
+        energy_tickers = ["XOM", "CVX", "COP", "EOG", "SLB"]  # ExxonMobil, Chevron, ConocoPhillips, EOG Resources, Schlumberger
+        
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=30)
+        
+        # All tickers in one round trip; ones that fail are simply left out
+        stock_data = self._download_closes(energy_tickers, start_date, end_date)
+        
+        if stock_data.empty:
             return None
+        
+        return stock_data
     
     def get_renewable_energy_data(self):
-        """Get renewable energy data using EIA API if available"""
+        """Get renewable energy data using EIA API if available, cached across reruns"""
         if not self.eia_api_key or self.eia_api_key == "your_eia_api_key" or self.eia_api_key == "":
             # Return sample structure if no API key or using placeholder
             st.warning("Using sample renewable energy data (no valid API key provided)")
-            return pd.DataFrame({
-                'Source': ['Solar', 'Wind', 'Hydro'],
-                'Capacity': [50.0, 120.0, 80.0],  # GW
-                'Generation': [45.0, 95.0, 75.0]  # TWh
-            })
+            return self._get_sample_renewable_data()
         
+        # Sample data stands in for a failed fetch without being cached, so the next rerun retries
         try:
-            st.info("Fetching renewable energy data from EIA API...")
-            
-            # EIA renewable energy data endpoint
-            url = f"{self.eia_base_url}/electricity/electric-power-operational-data/data"
-            params = {
-                'api_key': self.eia_api_key,
-                'frequency': 'monthly',
-                'data[0]': 'generation',
-                'facets[fueltypeid][]': ['SUN', 'WND', 'HYC'],  # Solar, Wind, Hydro
-                'sort[0][column]': 'period',
-                'sort[0][direction]': 'desc',
-                'offset': 0,
-                'length': 100
-            }
-            
-            response_data = self._make_request(url, params)
-            
-            if response_data is None:
-                st.warning("No data received from EIA API. Using sample data.")
-                return self._get_sample_renewable_data()
-                
-            if 'response' not in response_data or 'data' not in response_data['response']:
-                st.warning("Unexpected API response format. Using sample data.")
-                return self._get_sample_renewable_data()
-            
-            data = response_data['response']['data']
-            if not data:
-                st.warning("No data available from EIA API. Using sample data.")
-                return self._get_sample_renewable_data()
-                
-            df = pd.DataFrame(data)
-            
-            # Process the data
-            required_columns = {'generation', 'fueltypeid'}
-            if not required_columns.issubset(df.columns):
-                st.warning(f"Required columns not found in response. Available columns: {df.columns.tolist()}")
-                return self._get_sample_renewable_data()
-            
-            # Ensure generation is numeric
-            try:
-                df['generation'] = pd.to_numeric(df['generation'], errors='coerce')
-                df = df.dropna(subset=['generation'])
-                
-                if df.empty:
-                    st.warning("No valid generation data after cleaning. Using sample data.")
-                    return self._get_sample_renewable_data()
-                
-                # Process the data
-                df['period'] = pd.to_datetime(df['period'])
-                df = df.groupby('fueltypeid')['generation'].sum().reset_index()
-                
-                # Map fuel type IDs to readable names
-                fuel_map = {'SUN': 'Solar', 'WND': 'Wind', 'HYC': 'Hydro'}
-                df['Source'] = df['fueltypeid'].map(fuel_map)
-                
-                # Convert to float explicitly before division
-                df['Capacity'] = df['generation'].astype(float) / 1000.0  # Convert to GW equivalent
-                df['Generation'] = df['generation'].astype(float) / 1000.0  # Convert to TWh
-                
-                st.success("Successfully loaded renewable energy data from EIA API")
-                return df[['Source', 'Capacity', 'Generation']]
-                
-            except Exception as e:
-                st.warning(f"Error processing data: {str(e)}. Using sample data.")
-                return self._get_sample_renewable_data()
-            
+            return _cached_fetch(self, '_fetch_renewable_energy_data', self.eia_api_key)
+        except FetchError as e:
+            st.warning(f"{str(e)}. Using sample data.")
         except Exception as e:
             st.warning(f"Error fetching renewable energy data: {str(e)}. Using sample data.")
-            return self._get_sample_renewable_data()
+        return self._get_sample_renewable_data()
+    
+    def _fetch_renewable_energy_data(self):
+        """Get renewable energy data from the EIA API, raising FetchError when it has none"""
+        st.info("Fetching renewable energy data from EIA API...")
+        
+        # EIA renewable energy data endpoint
+        url = f"{self.eia_base_url}/electricity/electric-power-operational-data/data"
+        params = {
+            'api_key': self.eia_api_key,
+            'frequency': 'monthly',
+            'data[0]': 'generation',
+            'facets[fueltypeid][]': ['SUN', 'WND', 'HYC'],  # Solar, Wind, Hydro
+            'sort[0][column]': 'period',
+            'sort[0][direction]': 'desc',
+            'offset': 0,
+            'length': 100
+        }
+        
+        response_data = self._make_request(url, params)
+        
+        if response_data is None:
+            raise FetchError("No data received from EIA API")
+            
+        if 'response' not in response_data or 'data' not in response_data['response']:
+            raise FetchError("Unexpected API response format")
+        
+        data = response_data['response']['data']
+        if not data:
+            raise FetchError("No data available from EIA API")
+            
+        df = pd.DataFrame(data)
+        
+        # Process the data
+        required_columns = {'generation', 'fueltypeid'}
+        if not required_columns.issubset(df.columns):
+            raise FetchError(f"Required columns not found in response. Available columns: {df.columns.tolist()}")
+        
+        # Ensure generation is numeric
+        df['generation'] = pd.to_numeric(df['generation'], errors='coerce')
+        df = df.dropna(subset=['generation'])
+        
+        if df.empty:
+            raise FetchError("No valid generation data after cleaning")
+        
+        # Total generation per fuel type; with only a handful of types a sorted
+        # unique + bincount is cheaper than a hashed groupby (missing types dropped alike)
+        df = df[df['fueltypeid'].notna()]
+        fuel_types, fuel_index = np.unique(df['fueltypeid'].to_numpy(dtype=object), return_inverse=True)
+        df = pd.DataFrame({
+            'fueltypeid': fuel_types,
+            'generation': np.bincount(
+                fuel_index, weights=df['generation'].to_numpy(dtype=np.float64), minlength=len(fuel_types)
+            )
+        })
+        
+        # Map fuel type IDs to readable names
+        fuel_map = {'SUN': 'Solar', 'WND': 'Wind', 'HYC': 'Hydro'}
+        df['Source'] = df['fueltypeid'].map(fuel_map)
+        
+        # Convert to float explicitly before division
+        df['Capacity'] = df['generation'].astype(float) / 1000.0  # Convert to GW equivalent
+        df['Generation'] = df['generation'].astype(float) / 1000.0  # Convert to TWh
+        
+        st.success("Successfully loaded renewable energy data from EIA API")
+        return df[['Source', 'Capacity', 'Generation']]
     
     def _get_sample_renewable_data(self):
         """Helper method to return sample renewable data"""
-        return pd.DataFrame({
-            'Source': ['Solar', 'Wind', 'Hydro'],
-            'Capacity': [50.0, 120.0, 80.0],
-            'Generation': [45.0, 95.0, 75.0]
-        })
+        # A full copy, so callers' in-place edits can't reach the shared frame on any pandas version
+        return self._sample_renewable.copy()
     
     def get_economic_indicators(self):
-        """Get relevant economic indicators using FRED API"""
+        """Get relevant economic indicators using FRED API, cached across reruns"""
         if not self.fred_api_key:
             return None
         
-        try:
-            # Key economic indicators affecting energy markets
-            indicators = {
-                'GDP': 'GDP',
-                'Inflation': 'CPIAUCSL',
-                'USD_Index': 'DTWEXBGS',
-                'Interest_Rate': 'FEDFUNDS'
-            }
-            
-            economic_data = {}
-            
-            for name, series_id in indicators.items():
-                url = f"{self.fred_base_url}/series/observations"
-                params = {
-                    'series_id': series_id,
-                    'api_key': self.fred_api_key,
-                    'file_type': 'json',
-                    'limit': 12,  # Last 12 observations
-                    'sort_order': 'desc'
-                }
-                
-                response_data = self._make_request(url, params)
-                
-                if response_data and 'observations' in response_data:
-                    observations = response_data['observations']
-                    if observations:
-                        # Get the latest value
-                        latest = observations[0]
-                        if latest['value'] != '.':
-                            economic_data[name] = float(latest['value'])
-            
-            return economic_data if economic_data else None
-            
-        except Exception as e:
-            st.error(f"Error fetching economic indicators: {str(e)}")
-            return None
+        return self._fetch_through(_cached_fetch, '_fetch_economic_indicators', 'economic indicators', self.fred_api_key)
+    
+    def _fetch_economic_indicators(self):
+        """Get relevant economic indicators using FRED API"""
+        # Key economic indicators affecting energy markets
+        indicators = {
+            'GDP': 'GDP',
+            'Inflation': 'CPIAUCSL',
+            'USD_Index': 'DTWEXBGS',
+            'Interest_Rate': 'FEDFUNDS'
+        }
+        
+        economic_data = {}
+        
+        url = f"{self.fred_base_url}/series/observations"
+        requests_by_name = {
+            name: partial(self._make_request, url, {
+                'series_id': series_id,
+                'api_key': self.fred_api_key,
+                'file_type': 'json',
+                'limit': 12,  # Last 12 observations
+                'sort_order': 'desc'
+            })
+            for name, series_id in indicators.items()
+        }
+        
+        # The series are independent, so request them all at once
+        responses = fetch_concurrently(*requests_by_name.values())
+        
+        for name, response_data in zip(requests_by_name, responses):
+            if response_data and 'observations' in response_data:
+                observations = response_data['observations']
+                if observations:
+                    # Get the latest value
+                    latest = observations[0]
+                    if latest['value'] != '.':
+                        economic_data[name] = float(latest['value'])
+        
+        return economic_data if economic_data else None
     
     def get_alpha_vantage_commodities(self):
         """Get commodity data from Alpha Vantage"""
@@ -255,29 +336,35 @@ class EnergyDataAPI:
         
         try:
             commodities = ['WTI', 'BRENT', 'NATURAL_GAS']
-            commodity_data = {}
+            rows = []  # (commodity, date, value) across every commodity
             
-            for commodity in commodities:
-                url = self.alpha_vantage_base_url
-                params = {
+            # The commodities are independent, so request them all at once
+            responses = fetch_concurrently(*[
+                partial(self._make_request, self.alpha_vantage_base_url, {
                     'function': 'COMMODITY_PRICES',
                     'symbol': commodity,
                     'interval': 'daily',
                     'apikey': self.alpha_vantage_key
-                }
-                
-                response_data = self._make_request(url, params)
-                
+                })
+                for commodity in commodities
+            ])
+            
+            for commodity, response_data in zip(commodities, responses):
                 if response_data and 'data' in response_data:
-                    data = response_data['data']
-                    if data:
-                        df = pd.DataFrame(data)
-                        df['date'] = pd.to_datetime(df['date'])
-                        df.set_index('date', inplace=True)
-                        df['value'] = pd.to_numeric(df['value'], errors='coerce')
-                        commodity_data[commodity] = df['value']
+                    rows.extend((commodity, record['date'], record['value']) for record in response_data['data'])
+            
+            if not rows:
+                return None
+            
+            # One long frame, so dates and values are parsed once and aligned by a single pivot
+            long_df = pd.DataFrame(rows, columns=['commodity', 'date', 'value'])
+            long_df['date'] = pd.to_datetime(long_df['date'])
+            long_df['value'] = pd.to_numeric(long_df['value'], errors='coerce')
+            commodity_data = long_df.pivot(index='date', columns='commodity', values='value')
+            commodity_data.columns.name = None
             
-            return pd.DataFrame(commodity_data) if commodity_data else None
+            # Keep the request order rather than pivot's alphabetical columns
+            return commodity_data[[c for c in commodities if c in commodity_data.columns]]
             
         except Exception as e:
             st.error(f"Error fetching Alpha Vantage commodity data: {str(e)}")
@@ -3,63 +3,150 @@ import numpy as np
 from datetime import datetime, timedelta
 import streamlit as st
 
+# Market sentiment contribution of each trend; other trends count as neutral
+TREND_SCORE = {'Uptrend': 1, 'Downtrend': -1}
+
+DEFAULT_CHANGE_PERIODS = [1, 7, 30]
+
+def _default_price_changes(prices):
+    """_price_changes for the default periods on a series long enough for all of them"""
+    current_price = prices[-1]
+    past_1d, past_7d, past_30d = prices[-2], prices[-8], prices[-31]
+    change_1d = current_price - past_1d
+    change_7d = current_price - past_7d
+    change_30d = current_price - past_30d
+    return {
+        '1d_change': change_1d,
+        '1d_pct_change': (change_1d / past_1d) * 100,
+        '7d_change': change_7d,
+        '7d_pct_change': (change_7d / past_7d) * 100,
+        '30d_change': change_30d,
+        '30d_pct_change': (change_30d / past_30d) * 100
+    }
+
+def _price_changes(prices, periods):
+    """Absolute and percent change of the last price over each period"""
+    # Nearly every call uses the default periods on a full history: skip the loop and key formatting
+    if len(prices) > 30 and periods == DEFAULT_CHANGE_PERIODS:
+        return _default_price_changes(prices)
+    
+    changes = {}
+    current_price = prices[-1]
+    
+    for period in periods:
+        if len(prices) > period:
+            past_price = prices[-(period+1)]
+            change = current_price - past_price
+            pct_change = (change / past_price) * 100
+            changes[f'{period}d_change'] = change
+            changes[f'{period}d_pct_change'] = pct_change
+    
+    return changes
+
+def _trend(prices, window=10):
+    """Trend of a price array from its latest short (window//2) and long moving averages"""
+    # Only the latest averages are compared, so average just the last windows;
+    # a flat tail is Sideways even when its two means round apart in the last bit
+    if np.ptp(prices[-window:]) == 0:
+        return "Sideways"
+    
+    short_ma = prices[-(window//2):].mean()
+    long_ma = prices[-window:].mean()
+    
+    if short_ma > long_ma:
+        return "Uptrend"
+    elif short_ma < long_ma:
+        return "Downtrend"
+    else:
+        return "Sideways"
+
+def rolling_mean(values, window=20):
+    """Rolling mean down each column of a 1-D or 2-D array, NaN until the window fills"""
+    values = np.asarray(values, dtype=float)
+    result = np.full(values.shape, np.nan)
+    
+    if len(values) >= window:
+        if np.isnan(values).any():
+            # A running sum would carry a NaN forward, so only then average each window
+            windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+            result[window - 1:] = windows.mean(axis=-1)
+        else:
+            # Window sums as differences of one running sum: one pass for any window size
+            running = np.cumsum(np.insert(values, 0, 0.0, axis=0), axis=0)
+            result[window - 1:] = (running[window:] - running[:-window]) / window
+    
+    return result
+
+def rolling_std(values, window=20):
+    """Rolling sample standard deviation down each column of a 1-D or 2-D array"""
+    values = np.asarray(values, dtype=float)
+    result = np.full(values.shape, np.nan)
+    
+    if len(values) >= window:
+        if np.isnan(values).any():
+            windows = np.lib.stride_tricks.sliding_window_view(values, window, axis=0)
+            result[window - 1:] = windows.std(axis=-1, ddof=1)
+        else:
+            # Running sums of values and squares; centering first keeps the
+            # sum-of-squares subtraction from cancelling away precision
+            centered = values - values.mean(axis=0)
+            window_sum = rolling_mean(centered, window)[window - 1:] * window
+            window_sq = rolling_mean(centered * centered, window)[window - 1:] * window
+            variance = np.maximum(window_sq - window_sum * window_sum / window, 0) / (window - 1)
+            # Windows without a single price change are exactly 0, as pandas has them, not rounding residue
+            changes = np.cumsum(np.insert(np.diff(values, axis=0) != 0, 0, False, axis=0), axis=0)
+            variance[changes[window - 1:] == changes[:len(values) - window + 1]] = 0
+            result[window - 1:] = np.sqrt(variance)
+    
+    return result
+
 class DataProcessor:
     """Processes and analyzes energy market data"""
     
     def __init__(self):
         self.cache = {}
     
-    def calculate_price_changes(self, price_data, periods=[1, 7, 30]):
+    def calculate_price_changes(self, price_data, periods=DEFAULT_CHANGE_PERIODS):
         """Calculate price changes over different periods"""
         if price_data is None or price_data.empty:
             return None
         
-        changes = {}
-        current_price = price_data.iloc[-1]
-        
-        for period in periods:
-            if len(price_data) > period:
-                past_price = price_data.iloc[-(period+1)]
-                change = current_price - past_price
-                pct_change = (change / past_price) * 100
-                changes[f'{period}d_change'] = change
-                changes[f'{period}d_pct_change'] = pct_change
-        
-        return changes
+        return _price_changes(price_data.to_numpy(), periods)
     
     def calculate_volatility(self, price_data, window=20):
         """Calculate price volatility"""
         if price_data is None or price_data.empty or len(price_data) < window:
             return None
         
-        returns = price_data.pct_change().dropna()
-        volatility = returns.rolling(window=window).std() * np.sqrt(252)  # Annualized
+        prices = price_data.to_numpy(dtype=np.float64)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = prices[1:] / prices[:-1] - 1
+        returns = returns[~np.isnan(returns)]
+        
+        if len(returns) == 0:
+            return None
+        if len(returns) < window:
+            return np.nan
         
-        return volatility.iloc[-1] if not volatility.empty else None
+        # Only the latest window is reported, so take its std directly
+        return returns[-window:].std(ddof=1) * np.sqrt(252)  # Annualized
     
     def detect_trend(self, price_data, window=10):
         """Detect price trend using moving averages"""
         if price_data is None or price_data.empty or len(price_data) < window:
             return "Insufficient Data"
         
-        short_ma = price_data.rolling(window=window//2).mean()
-        long_ma = price_data.rolling(window=window).mean()
-        
-        if short_ma.iloc[-1] > long_ma.iloc[-1]:
-            return "Uptrend"
-        elif short_ma.iloc[-1] < long_ma.iloc[-1]:
-            return "Downtrend"
-        else:
-            return "Sideways"
+        return _trend(price_data.to_numpy(dtype=np.float64), window)
     
     def calculate_support_resistance(self, price_data, window=20):
         """Calculate support and resistance levels"""
         if price_data is None or price_data.empty or len(price_data) < window:
             return None, None
         
-        # Use rolling min/max as basic support/resistance
-        support = price_data.rolling(window=window).min().iloc[-1]
-        resistance = price_data.rolling(window=window).max().iloc[-1]
+        # Use the latest window's min/max as basic support/resistance
+        prices = price_data.to_numpy(dtype=np.float64)[-window:]
+        support = prices.min()
+        resistance = prices.max()
         
         return support, resistance
     
@@ -68,13 +155,52 @@ class DataProcessor:
         if data1 is None or data2 is None or data1.empty or data2.empty:
             return None
         
-        # Align the data by index
-        aligned_data = pd.concat([data1, data2], axis=1, join='inner')
-        if aligned_data.shape[0] < 2:
+        # Align the data by index, straight into arrays
+        shared_dates = data1.index.intersection(data2.index)
+        if len(shared_dates) < 2:
             return None
         
-        correlation = aligned_data.corr().iloc[0, 1]
-        return correlation
+        x = data1.reindex(shared_dates).to_numpy(dtype=np.float64)
+        y = data2.reindex(shared_dates).to_numpy(dtype=np.float64)
+        
+        # Pairs with a missing side are skipped, as DataFrame.corr does
+        valid = ~(np.isnan(x) | np.isnan(y))
+        if valid.sum() < 2:
+            return np.nan
+        
+        # Only r is needed, so skip corrcoef's covariance matrix: center once, three dot products
+        x_centered = x[valid] - x[valid].mean()
+        y_centered = y[valid] - y[valid].mean()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            correlation = (x_centered @ y_centered) / np.sqrt((x_centered @ x_centered) * (y_centered @ y_centered))
+        # Rounding can push |r| just past 1, which corrcoef clips as well
+        return np.clip(correlation, -1, 1)
+    
+    def _summarize_prices(self, prices):
+        """Summarize one gap-free price array from its latest values only"""
+        # Every summary metric only reads the end of the array, so slice it here
+        # instead of running each rolling window end to end
+        n = len(prices)
+        
+        # Same windows as calculate_volatility (20), detect_trend (10) and
+        # calculate_support_resistance (20)
+        volatility = None
+        support_resistance = (None, None)
+        if n >= 20:
+            tail = prices[-21:]
+            returns = tail[1:] / tail[:-1] - 1
+            volatility = returns.std(ddof=1) * np.sqrt(252) if len(returns) == 20 else np.nan
+            support_resistance = (prices[-20:].min(), prices[-20:].max())
+        
+        trend = _trend(prices, 10) if n >= 10 else "Insufficient Data"
+        
+        return {
+            'current_price': prices[-1],
+            'changes': _price_changes(prices, DEFAULT_CHANGE_PERIODS),
+            'volatility': volatility,
+            'trend': trend,
+            'support_resistance': support_resistance
+        }
     
     def generate_market_summary(self, oil_data, gas_data, stock_data=None):
         """Generate comprehensive market summary"""
@@ -85,53 +211,29 @@ class DataProcessor:
             'market_sentiment': 'Neutral'
         }
         
+        # Each column is pulled out and stripped of gaps once, then summarized as a plain array
         # Oil analysis
         if oil_data is not None and not oil_data.empty:
             for column in oil_data.columns:
-                price_series = oil_data[column].dropna()
-                if not price_series.empty:
-                    summary['oil_analysis'][column] = {
-                        'current_price': price_series.iloc[-1],
-                        'changes': self.calculate_price_changes(price_series),
-                        'volatility': self.calculate_volatility(price_series),
-                        'trend': self.detect_trend(price_series),
-                        'support_resistance': self.calculate_support_resistance(price_series)
-                    }
+                prices = oil_data[column].to_numpy(dtype=np.float64)
+                prices = prices[~np.isnan(prices)]
+                if len(prices):
+                    summary['oil_analysis'][column] = self._summarize_prices(prices)
         
         # Gas analysis
         if gas_data is not None and not gas_data.empty:
-            price_series = gas_data['Price'].dropna()
-            if not price_series.empty:
-                summary['gas_analysis'] = {
-                    'current_price': price_series.iloc[-1],
-                    'changes': self.calculate_price_changes(price_series),
-                    'volatility': self.calculate_volatility(price_series),
-                    'trend': self.detect_trend(price_series),
-                    'support_resistance': self.calculate_support_resistance(price_series)
-                }
-        
-        # Market sentiment (simplified)
-        sentiment_score = 0
-        sentiment_factors = 0
-        
-        # Check oil trends
-        for oil_type, analysis in summary['oil_analysis'].items():
-            if analysis['trend'] == 'Uptrend':
-                sentiment_score += 1
-            elif analysis['trend'] == 'Downtrend':
-                sentiment_score -= 1
-            sentiment_factors += 1
-        
-        # Check gas trend
+            prices = gas_data['Price'].to_numpy(dtype=np.float64)
+            prices = prices[~np.isnan(prices)]
+            if len(prices):
+                summary['gas_analysis'] = self._summarize_prices(prices)
+        
+        # Market sentiment (simplified): every oil trend and the gas trend score one factor
+        trend_scores = [TREND_SCORE.get(analysis['trend'], 0) for analysis in summary['oil_analysis'].values()]
         if summary['gas_analysis'] and summary['gas_analysis']['trend']:
-            if summary['gas_analysis']['trend'] == 'Uptrend':
-                sentiment_score += 1
-            elif summary['gas_analysis']['trend'] == 'Downtrend':
-                sentiment_score -= 1
-            sentiment_factors += 1
-        
-        if sentiment_factors > 0:
-            avg_sentiment = sentiment_score / sentiment_factors
+            trend_scores.append(TREND_SCORE.get(summary['gas_analysis']['trend'], 0))
+        
+        if trend_scores:
+            avg_sentiment = sum(trend_scores) / len(trend_scores)
             if avg_sentiment > 0.3:
                 summary['market_sentiment'] = 'Bullish'
             elif avg_sentiment < -0.3:
@@ -162,10 +264,18 @@ class DataProcessor:
         if price_data is None or price_data.empty:
             return None
         
-        z_scores = np.abs((price_data - price_data.mean()) / price_data.std())
-        anomalies = price_data[z_scores > threshold]
+        prices = price_data.to_numpy(dtype=np.float64)
+        valid = ~np.isnan(prices)
+        if valid.sum() < 2:
+            return None
+        
+        # Z-scores on the raw array, then pick the anomalies by position
+        valid_prices = prices[valid]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            z_scores = np.abs(prices - valid_prices.mean()) / valid_prices.std(ddof=1)
+        anomaly_positions = np.flatnonzero(z_scores > threshold)
         
-        return anomalies if not anomalies.empty else None
+        return price_data.iloc[anomaly_positions] if len(anomaly_positions) else None
     
     def calculate_moving_averages(self, price_data, windows=[5, 10, 20, 50]):
         """Calculate multiple moving averages"""
@@ -175,12 +285,40 @@ class DataProcessor:
         ma_data = pd.DataFrame(index=price_data.index)
         ma_data['price'] = price_data
         
+        prices = price_data.to_numpy(dtype=np.float64)
         for window in windows:
             if len(price_data) >= window:
-                ma_data[f'MA_{window}'] = price_data.rolling(window=window).mean()
+                ma_data[f'MA_{window}'] = rolling_mean(prices, window)
         
         return ma_data
     
+    def downsample_lttb(self, x, y, threshold=2000):
+        """Downsample a series for plotting using Largest-Triangle-Three-Buckets"""
+        n = len(y)
+        if threshold < 3 or n <= threshold:
+            return x, y
+        
+        y = np.asarray(y, dtype=float)
+        
+        # Interior points split into threshold - 2 buckets; first and last are always kept
+        edges = np.append(np.linspace(1, n - 1, threshold - 1).astype(np.int64), n)
+        keep = np.zeros(threshold, dtype=np.int64)
+        keep[-1] = n - 1
+        
+        a = 0
+        for i in range(threshold - 2):
+            lo, hi = edges[i], edges[i + 1]
+            # Average of the next bucket is the third triangle vertex
+            avg_x = (edges[i + 1] + edges[i + 2] - 1) / 2.0
+            avg_y = y[edges[i + 1]:edges[i + 2]].mean()
+            
+            candidates = np.arange(lo, hi)
+            area = np.abs((a - avg_x) * (y[lo:hi] - y[a]) - (a - candidates) * (avg_y - y[a]))
+            a = lo + int(np.argmax(np.nan_to_num(area, nan=-1.0)))
+            keep[i + 1] = a
+        
+        return np.asarray(x)[keep], y[keep]
+    
     def export_data_csv(self, data, filename=None):
         """Export data to CSV format"""
         if data is None or (isinstance(data, pd.DataFrame) and data.empty):
@@ -201,22 +339,23 @@ class DataProcessor:
         if price_data is None or price_data.empty or len(price_data) < window + 1:
             return None
         
-        delta = price_data.diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=window).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=window).mean()
-        
-        rs = gain / loss
-        rsi = 100 - (100 / (1 + rs))
+        # Only the latest RSI is returned, so average just the last `window` price changes
+        delta = np.diff(price_data.to_numpy(dtype=np.float64)[-(window + 1):])
+        gain = np.where(delta > 0, delta, 0).mean()
+        loss = np.where(delta < 0, -delta, 0).mean()
         
-        return rsi.iloc[-1] if not rsi.empty else None
+        with np.errstate(divide='ignore', invalid='ignore'):
+            rs = gain / loss
+        return 100 - (100 / (1 + rs))
     
     def calculate_bollinger_bands(self, price_data, window=20, num_std=2):
         """Calculate Bollinger Bands"""
         if price_data is None or price_data.empty or len(price_data) < window:
             return None
         
-        ma = price_data.rolling(window=window).mean()
-        std = price_data.rolling(window=window).std()
+        prices = price_data.to_numpy(dtype=np.float64)
+        ma = pd.Series(rolling_mean(prices, window), index=price_data.index, name=price_data.name)
+        std = pd.Series(rolling_std(prices, window), index=price_data.index, name=price_data.name)
         
         upper_band = ma + (std * num_std)
         lower_band = ma - (std * num_std)
@@ -7,6 +7,8 @@ from sklearn.metrics import mean_absolute_error, mean_squared_error
 from datetime import datetime, timedelta
 import streamlit as st
 
+from utils.data_processor import rolling_mean, rolling_std
+
 class EnergyForecasting:
     """Time series forecasting for energy prices"""
     
@@ -33,6 +35,24 @@ class EnergyForecasting:
         
         return df
     
+    def time_features_for(self, date):
+        """Time-based features for a single date, as create_time_features builds them"""
+        # A handful of scalar operations, so computed fresh rather than memoized per date
+        day_of_week = date.dayofweek
+        month = date.month
+        return {
+            'day_of_week': day_of_week,
+            'day_of_month': date.day,
+            'month': month,
+            'quarter': date.quarter,
+            'year': date.year,
+            'day_of_year': date.dayofyear,
+            'day_of_week_sin': np.sin(2 * np.pi * day_of_week / 7),
+            'day_of_week_cos': np.cos(2 * np.pi * day_of_week / 7),
+            'month_sin': np.sin(2 * np.pi * month / 12),
+            'month_cos': np.cos(2 * np.pi * month / 12)
+        }
+    
     def create_lag_features(self, price_series, lags=[1, 2, 3, 5, 7, 14]):
         """Create lagged features for price prediction"""
         df = pd.DataFrame()
@@ -46,25 +66,26 @@ class EnergyForecasting:
         """Create technical analysis features"""
         df = pd.DataFrame(index=price_series.index)
         
-        # Moving averages
+        # Moving averages, each from one running sum
+        prices = price_series.to_numpy(dtype=np.float64)
         for window in [5, 10, 20]:
-            df[f'ma_{window}'] = price_series.rolling(window=window).mean()
+            df[f'ma_{window}'] = rolling_mean(prices, window)
             df[f'ma_ratio_{window}'] = price_series / df[f'ma_{window}']
         
-        # Volatility
-        df['volatility_5'] = price_series.rolling(window=5).std()
-        df['volatility_20'] = price_series.rolling(window=20).std()
+        # Volatility, from the same running sums
+        df['volatility_5'] = rolling_std(prices, 5)
+        df['volatility_20'] = rolling_std(prices, 20)
         
         # Price changes
         df['pct_change_1'] = price_series.pct_change(1, fill_method=None)
         df['pct_change_5'] = price_series.pct_change(5, fill_method=None)
         
-        # RSI
-        delta = price_series.diff()
-        gain = (delta.where(delta > 0, 0)).rolling(window=14).mean()
-        loss = (-delta.where(delta < 0, 0)).rolling(window=14).mean()
-        rs = gain / loss
-        df['rsi'] = 100 - (100 / (1 + rs))
+        # RSI in one NumPy pass; a missing change counts as no gain and no loss, as before
+        delta = np.diff(price_series.to_numpy(dtype=np.float64), prepend=np.nan)
+        gain = rolling_mean(np.where(delta > 0, delta, 0), 14)
+        loss = rolling_mean(np.where(delta < 0, -delta, 0), 14)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            df['rsi'] = 100 - (100 / (1 + gain / loss))
         
         return df
     
@@ -86,6 +107,67 @@ class EnergyForecasting:
         
         return features
     
+    def prepare_training_features(self, price_series):
+        """Prepare features for training, reusing the rows built for an earlier prefix of the series"""
+        key = ('training_features', price_series.name)
+        cached = self.features_cache.get(key)
+        
+        if cached is not None:
+            cached_series, cached_features = cached
+            n_cached = len(cached_series)
+            
+            # Same data as last time, possibly with new points appended
+            if len(price_series) >= n_cached and price_series.iloc[:n_cached].equals(cached_series):
+                if len(price_series) == n_cached:
+                    return cached_features
+                
+                # New rows only need the 20 points before them as lag and rolling-window context
+                tail_features = self.prepare_features(price_series.iloc[max(0, n_cached - 20):])
+                new_features = tail_features[tail_features.index.isin(price_series.index[n_cached:])]
+                features = pd.concat([cached_features, new_features])
+                self.features_cache[key] = (price_series.copy(), features)
+                return features
+        
+        features = self.prepare_features(price_series)
+        self.features_cache[key] = (price_series.copy(), features)
+        return features
+    
+    def latest_features(self, prices, date):
+        """Feature dict for the last of an array of prices, dated `date`, built from its tail only"""
+        # Every lag and rolling window in prepare_features reaches back at most 20 points
+        prices = prices[-21:]
+        if len(prices) < 21:
+            return None
+        
+        current = prices[-1]
+        features = self.time_features_for(date)
+        
+        for lag in [1, 2, 3, 5, 7, 14]:
+            features[f'lag_{lag}'] = prices[-1 - lag]
+        
+        for window in [5, 10, 20]:
+            features[f'ma_{window}'] = prices[-window:].mean()
+            features[f'ma_ratio_{window}'] = current / features[f'ma_{window}']
+        
+        features['volatility_5'] = prices[-5:].std(ddof=1)
+        features['volatility_20'] = prices[-20:].std(ddof=1)
+        
+        features['pct_change_1'] = current / prices[-2] - 1
+        features['pct_change_5'] = current / prices[-6] - 1
+        
+        # RSI from simple 14-day means of gains and losses, as in create_technical_features
+        delta = np.diff(prices[-15:])
+        gain = np.where(delta > 0, delta, 0).mean()
+        loss = np.where(delta < 0, -delta, 0).mean()
+        with np.errstate(divide='ignore', invalid='ignore'):
+            features['rsi'] = 100 - (100 / (1 + gain / loss))
+        
+        # prepare_features would drop an incomplete row, so let the caller fall back
+        if np.isnan(list(features.values())).any():
+            return None
+        
+        return features
+    
     def train_model(self, price_series, model_type='random_forest', test_size=0.2):
         """Train forecasting model"""
         if price_series is None or price_series.empty or len(price_series) < 30:
@@ -94,7 +176,7 @@ class EnergyForecasting:
         
         try:
             # Prepare features
-            features_df = self.prepare_features(price_series)
+            features_df = self.prepare_training_features(price_series)
             
             if features_df.empty:
                 st.error("No valid features could be created from the data")
@@ -109,10 +191,15 @@ class EnergyForecasting:
             X_train, X_test = X[:split_idx], X[split_idx:]
             y_train, y_test = y[:split_idx], y[split_idx:]
             
-            # Scale features
+            # The forest splits on float32 anyway, so its features stay float32 throughout and
+            # move half the bytes; least squares keeps float64 on these poorly conditioned features
+            feature_dtype = np.float32 if model_type == 'random_forest' else np.float64
+            
+            # Scale features (as plain arrays, so forecasting can transform bare NumPy rows);
+            # column-major, so the scaler's per-feature statistics read contiguous memory
             scaler = StandardScaler()
-            X_train_scaled = scaler.fit_transform(X_train)
-            X_test_scaled = scaler.transform(X_test)
+            X_train_scaled = scaler.fit_transform(np.asfortranarray(X_train.to_numpy(dtype=feature_dtype)))
+            X_test_scaled = scaler.transform(np.asfortranarray(X_test.to_numpy(dtype=feature_dtype)))
             
             # Train model
             if model_type == 'random_forest':
@@ -136,10 +223,19 @@ class EnergyForecasting:
             train_rmse = np.sqrt(mean_squared_error(y_train, train_pred))
             test_rmse = np.sqrt(mean_squared_error(y_test, test_pred))
             
+            # A linear model on standardized features is still linear in the raw features,
+            # so fold the scaler into its weights and forecast with a single dot product
+            fused_weights = None
+            if model_type != 'random_forest':
+                weights = model.coef_ / scaler.scale_
+                fused_weights = (weights, model.intercept_ - scaler.mean_ @ weights)
+            
             model_info = {
                 'model': model,
                 'scaler': scaler,
                 'feature_columns': X.columns.tolist(),
+                'feature_dtype': feature_dtype,
+                'fused_weights': fused_weights,
                 'train_mae': train_mae,
                 'test_mae': test_mae,
                 'train_rmse': train_rmse,
@@ -170,46 +266,66 @@ class EnergyForecasting:
             forecasts = []
             forecast_dates = []
             
-            # Generate forecasts day by day
-            current_series = recent_data.copy()
+            # One feature row in training column order, refilled in place every step
+            feature_row = np.zeros((1, len(feature_columns)), dtype=model_info.get('feature_dtype', np.float64))
+            scaled_row = np.empty_like(feature_row)
+            fused_weights = model_info.get('fused_weights')
+            # Scaler statistics in the row's dtype, as StandardScaler.transform applies them
+            scale_mean = scaler.mean_.astype(feature_row.dtype)
+            scale_std = scaler.scale_.astype(feature_row.dtype)
+            
+            # Generate forecasts day by day into a preallocated array of the context and every
+            # forecast, so each step fills one slot instead of growing a Series label by label
+            history = np.empty(len(recent_data) + forecast_days)
+            history[:len(recent_data)] = recent_data.to_numpy(dtype=np.float64)
+            n_prices = len(recent_data)
+            last_date = recent_data.index[-1]
             
             for i in range(forecast_days):
                 # Create next date
-                next_date = current_series.index[-1] + timedelta(days=1)
+                next_date = last_date + timedelta(days=1)
                 forecast_dates.append(next_date)
                 
-                # Prepare features for next prediction
-                extended_series = current_series.copy()
-                extended_series.loc[next_date] = np.nan  # Placeholder
-                
-                features_df = self.prepare_features(extended_series)
-                
-                if features_df.empty:
-                    break
+                # The prediction row has no target, so the newest complete row drives the
+                # forecast; build just that row from the tail instead of every feature
+                last_features = self.latest_features(history[:n_prices], last_date)
                 
-                # Get features for the last (prediction) row
-                last_features = features_df.iloc[-1:].drop('target', axis=1, errors='ignore')
+                if last_features is None:
+                    # Gaps in the tail: take the last complete row of the full feature frame,
+                    # built over at most the latest 100 points
+                    start = max(0, n_prices - 100)
+                    dates = recent_data.index.append(pd.Index(forecast_dates))
+                    extended_series = pd.Series(
+                        np.append(history[start:n_prices], np.nan),  # Placeholder
+                        index=dates[start:n_prices + 1]
+                    )
+                    
+                    features_df = self.prepare_features(extended_series)
+                    
+                    if features_df.empty:
+                        break
+                    
+                    last_features = features_df.iloc[-1].drop('target', errors='ignore').to_dict()
                 
-                # Ensure we have all required features
-                missing_features = set(feature_columns) - set(last_features.columns)
-                for feature in missing_features:
-                    last_features[feature] = 0  # Fill missing features with 0
+                # Fill the row in training column order; features missing here are 0
+                for j, feature in enumerate(feature_columns):
+                    feature_row[0, j] = last_features.get(feature, 0)
                 
-                # Reorder columns to match training
-                last_features = last_features[feature_columns]
-                
-                # Scale features and predict
-                last_features_scaled = scaler.transform(last_features)
-                prediction = model.predict(last_features_scaled)[0]
+                # Scale features and predict, skipping the estimators' per-call validation
+                if fused_weights is not None:
+                    weights, intercept = fused_weights
+                    prediction = float(feature_row[0] @ weights + intercept)
+                else:
+                    np.subtract(feature_row, scale_mean, out=scaled_row)
+                    np.divide(scaled_row, scale_std, out=scaled_row)
+                    prediction = model.predict(scaled_row)[0]
                 
                 forecasts.append(prediction)
                 
-                # Add prediction to series for next iteration
-                current_series.loc[next_date] = prediction
-                
-                # Keep only recent data to avoid memory issues
-                if len(current_series) > 100:
-                    current_series = current_series.tail(80)
+                # Add prediction to the history for the next iteration
+                history[n_prices] = prediction
+                n_prices += 1
+                last_date = next_date
             
             # Create forecast dataframe
             forecast_df = pd.DataFrame({
@@ -254,22 +370,29 @@ class EnergyForecasting:
             return None
         
         try:
-            # Align the data
-            aligned_data = pd.concat([actual_prices, forecasted_prices], axis=1, join='inner')
-            if aligned_data.shape[0] < 2:
+            # A forecast frame is compared on its first (forecast) column
+            if isinstance(actual_prices, pd.DataFrame):
+                actual_prices = actual_prices.iloc[:, 0]
+            if isinstance(forecasted_prices, pd.DataFrame):
+                forecasted_prices = forecasted_prices.iloc[:, 0]
+            
+            # Align the data on shared dates, straight into arrays
+            shared_dates = actual_prices.index.intersection(forecasted_prices.index)
+            if len(shared_dates) < 2:
                 return None
             
-            actual = aligned_data.iloc[:, 0]
-            forecast = aligned_data.iloc[:, 1]
+            actual = actual_prices.reindex(shared_dates).to_numpy(dtype=np.float64)
+            forecast = forecasted_prices.reindex(shared_dates).to_numpy(dtype=np.float64)
             
             # Calculate metrics
-            mae = mean_absolute_error(actual, forecast)
-            rmse = np.sqrt(mean_squared_error(actual, forecast))
-            mape = np.mean(np.abs((actual - forecast) / actual)) * 100
+            errors = actual - forecast
+            mae = np.abs(errors).mean()
+            rmse = np.sqrt((errors * errors).mean())
+            mape = np.mean(np.abs(errors / actual)) * 100
             
             # Direction accuracy
-            actual_direction = np.sign(actual.diff().dropna())
-            forecast_direction = np.sign(forecast.diff().dropna())
+            actual_direction = np.sign(np.diff(actual))
+            forecast_direction = np.sign(np.diff(forecast))
             direction_accuracy = np.mean(actual_direction == forecast_direction) * 100
             
             return {
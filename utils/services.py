@@ -0,0 +1,43 @@
+import streamlit as st
+
+from utils.api_clients import EnergyDataAPI, fetch_concurrently
+from utils.data_processor import DataProcessor
+from utils.alerts import AlertSystem
+
+@st.cache_resource
+def get_services():
+    """Get the shared API client, data processor and alert system"""
+    api_client = EnergyDataAPI()
+    data_processor = DataProcessor()
+    alert_system = AlertSystem()
+    return api_client, data_processor, alert_system
+
+@st.cache_resource
+def get_forecasting():
+    """Get the shared forecasting engine"""
+    # Imported here so pages that never forecast don't pay for scikit-learn
+    from utils.forecasting import EnergyForecasting
+    return EnergyForecasting()
+
+# Commodity label -> (price history frame, column) as returned by load_price_history
+COMMODITY_COLUMNS = {
+    "WTI Crude": ("oil", "WTI"),
+    "Brent Crude": ("oil", "Brent"),
+    "Natural Gas": ("gas", "Price")
+}
+
+@st.cache_data(ttl=1800, show_spinner=False)
+def load_price_history():
+    """Fetch full oil and gas price history once for every page and period"""
+    api_client = get_services()[0]
+    oil_data, gas_data = fetch_concurrently(
+        api_client.get_oil_prices, api_client.get_natural_gas_prices
+    )
+    
+    # Callers slice by date with .loc, which needs a sorted index
+    if oil_data is not None and not oil_data.index.is_monotonic_increasing:
+        oil_data = oil_data.sort_index()
+    if gas_data is not None and not gas_data.index.is_monotonic_increasing:
+        gas_data = gas_data.sort_index()
+    
+    return oil_data, gas_data